@@ -8,6 +8,9 @@ def create_tables(conn):
     # Enable foreign key constraints
     cursor.execute('PRAGMA foreign_keys = ON;')
 
+    # Write-ahead logging, so that extraction and parameter queries can read while the generator inserts
+    cursor.execute('PRAGMA journal_mode = WAL;')
+
     # Create table: Sales Order Documents
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS SalesOrderDocuments (
@@ -1,9 +1,15 @@
-import sqlite3
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import pandas as pd
 import numpy as np
+from db_access import ConnectionPool, read_sql
+from object_registry import ObjectRegistry, encode_event_log, event_log_csv_frame, write_event_log_csv
+from event_store import write_event_store
 
 
-query = """
+events_query = """
 WITH StockChanges AS (
     SELECT
         material_number,
@@ -23,8 +29,10 @@ AllEvents AS (
         os.date AS Timestamp,
         os.article_number AS "Obj Type MAT",
         os.plant AS "Obj Type PLA",
-        NULL AS "Obj Type PO_ITEM",
-        NULL AS "Obj Type SO_ITEM",
+        NULL AS "PO Document",
+        NULL AS "PO Item",
+        NULL AS "SO Document",
+        NULL AS "SO Item",
         NULL AS "Obj Type CUSTOMER",
         NULL AS "Obj Type SUPPLIER",
         0 AS quantity_change
@@ -41,8 +49,10 @@ AllEvents AS (
         pod.purchase_order_date AS Timestamp,
         poi.material_number AS "Obj Type MAT",
         poi.plant AS "Obj Type PLA",
-        poi.purchase_order_number || '-' || poi.purchase_order_item_number AS "Obj Type PO_ITEM",
-        NULL AS "Obj Type SO_ITEM",
+        poi.purchase_order_number AS "PO Document",
+        poi.purchase_order_item_number AS "PO Item",
+        NULL AS "SO Document",
+        NULL AS "SO Item",
         NULL AS "Obj Type CUSTOMER",
         pod.account_number_of_vendor AS "Obj Type SUPPLIER",
         0 AS quantity_change
@@ -60,8 +70,10 @@ AllEvents AS (
         gri.date_of_the_posting_in_the_document AS Timestamp,
         gri.material_number AS "Obj Type MAT",
         gri.plant AS "Obj Type PLA",
-        gri.purchase_document_number || '-' || gri.line_item_in_purchase_document AS "Obj Type PO_ITEM",
-        NULL AS "Obj Type SO_ITEM",
+        gri.purchase_document_number AS "PO Document",
+        gri.line_item_in_purchase_document AS "PO Item",
+        NULL AS "SO Document",
+        NULL AS "SO Item",
         NULL AS "Obj Type CUSTOMER",
         pod.account_number_of_vendor AS "Obj Type SUPPLIER",
         gri.quantity AS quantity_change  -- Positive quantity
@@ -79,8 +91,10 @@ AllEvents AS (
         sod.document_creation_date AS Timestamp,
         soi.material_number AS "Obj Type MAT",
         soi.plant AS "Obj Type PLA",
-        NULL AS "Obj Type PO_ITEM",
-        soi.sales_document_number || '-' || soi.item_number AS "Obj Type SO_ITEM",
+        NULL AS "PO Document",
+        NULL AS "PO Item",
+        soi.sales_document_number AS "SO Document",
+        soi.item_number AS "SO Item",
         sod.customer_number AS "Obj Type CUSTOMER",
         NULL AS "Obj Type SUPPLIER",
         0 AS quantity_change
@@ -98,8 +112,10 @@ AllEvents AS (
         gri.date_of_the_posting_in_the_document AS Timestamp,
         gri.material_number AS "Obj Type MAT",
         gri.plant AS "Obj Type PLA",
-        NULL AS "Obj Type PO_ITEM",
-        NULL AS "Obj Type SO_ITEM",
+        NULL AS "PO Document",
+        NULL AS "PO Item",
+        NULL AS "SO Document",
+        NULL AS "SO Item",
         gri.reference_document_number AS "Obj Type CUSTOMER",
         NULL AS "Obj Type SUPPLIER",
         -gri.quantity AS quantity_change  -- Negative quantity
@@ -108,14 +124,19 @@ AllEvents AS (
     WHERE
         gri.movement_type = 'Goods Issue' AND gri.material_number IS NOT NULL
 )
+"""
 
+# Stock before and after every event, accumulated per material over AllEvents
+stock_query = """
 SELECT
     Activity,
     Timestamp,
     "Obj Type MAT",
     "Obj Type PLA",
-    "Obj Type PO_ITEM",
-    "Obj Type SO_ITEM",
+    "PO Document",
+    "PO Item",
+    "SO Document",
+    "SO Item",
     "Obj Type CUSTOMER",
     "Obj Type SUPPLIER",
     SUM(quantity_change) OVER (
@@ -137,37 +158,192 @@ ORDER BY
     Timestamp;
 """
 
+query = events_query + stock_query
 
-def extract_event_log(db_path):
-    conn = sqlite3.connect(db_path)
-    event_log = pd.read_sql_query(query, conn)
-    conn.close()
-    return event_log
+# Timestamp and material of every branch of AllEvents, keyed by the branch's WHERE condition
+BRANCH_COLUMNS = {
+    "os.article_number IS NOT NULL": ("os.date", "os.article_number"),
+    "poi.material_number IS NOT NULL": ("pod.purchase_order_date", "poi.material_number"),
+    "gri.movement_type = 'Goods Receipt' AND gri.material_number IS NOT NULL":
+        ("gri.date_of_the_posting_in_the_document", "gri.material_number"),
+    "soi.material_number IS NOT NULL": ("sod.document_creation_date", "soi.material_number"),
+    "gri.movement_type = 'Goods Issue' AND gri.material_number IS NOT NULL":
+        ("gri.date_of_the_posting_in_the_document", "gri.material_number"),
+}
 
 
-def fix_type_column(x, col):
-    if x is None or pd.isna(x):
-        return x
-    if type(x) is not str:
-        x = str(int(x))
-    col = col.split("ocel:type:")[1]
-    if "MAT" not in col and "PLA" not in col:
-        x = col+"--"+x
-    return [x]
+def filtered_events_query(restriction):
+    # AllEvents with restriction(timestamp, material) added inside every branch, so that only matching rows are read
+    sql = events_query
+    for condition, (timestamp, material) in BRANCH_COLUMNS.items():
+        sql = sql.replace(condition, "%s AND %s" % (condition, restriction(timestamp, material)))
+    return sql
 
 
-if __name__ == '__main__':
-    event_log_df = extract_event_log('inventory_management.db')
-    event_log_df = event_log_df.rename(columns={"Activity": "ocel:activity", "Timestamp": "ocel:timestamp",
-                                                "Obj Type MAT": "ocel:type:MAT", "Obj Type PLA": "ocel:type:PLA", "Obj Type PO_ITEM": "ocel:type:PO_ITEM",
-                                                "Obj Type SO_ITEM": "ocel:type:SO_ITEM", "Obj Type CUSTOMER": "ocel:type:CUSTOMER",
-                                                "Obj Type SUPPLIER": "ocel:type:SUPPLIER"})
-    event_log_df["ocel:type:MAT"] = "MAT-"+event_log_df["ocel:type:MAT"].astype("string")
-    event_log_df["ocel:type:PLA"] = event_log_df["ocel:type:PLA"].astype("string")
-    event_log_df["ocel:type:MAT_PLA"] = event_log_df["ocel:type:MAT"] + "_" + event_log_df["ocel:type:PLA"]
+# Events of the materials in the JSON array :materials; the stock is accumulated per material, so it is exact
+materials_query = filtered_events_query(
+    lambda timestamp, material: "%s IN (SELECT value FROM json_each(:materials))" % material) + stock_query
+
+# Events of [:start, :end) with the stock changes accumulated within the partition only
+partition_query = filtered_events_query(
+    lambda timestamp, material: "COALESCE(%s, '') >= :start AND COALESCE(%s, '') < :end" % (timestamp, timestamp)
+) + """
+SELECT
+    Activity,
+    Timestamp,
+    "Obj Type MAT",
+    "Obj Type PLA",
+    "PO Document",
+    "PO Item",
+    "SO Document",
+    "SO Item",
+    "Obj Type CUSTOMER",
+    "Obj Type SUPPLIER",
+    SUM(quantity_change) OVER (
+        PARTITION BY "Obj Type MAT"
+        ORDER BY Timestamp
+        ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ) AS partition_stock_before,
+    SUM(quantity_change) OVER (
+        PARTITION BY "Obj Type MAT"
+        ORDER BY Timestamp
+        ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+    ) AS partition_stock_after
+FROM
+    AllEvents
+WHERE
+    "Obj Type MAT" IS NOT NULL
+ORDER BY
+    "Obj Type MAT",
+    Timestamp;
+"""
+
+# Stock change of every material per month, from which the opening stock of all partitions is accumulated
+monthly_query = events_query + """
+SELECT
+    "Obj Type MAT" AS material_number,
+    SUBSTR(COALESCE(Timestamp, ''), 1, 7) AS month,
+    SUM(quantity_change) AS quantity_change,
+    COUNT(*) AS events
+FROM
+    AllEvents
+WHERE
+    "Obj Type MAT" IS NOT NULL
+GROUP BY
+    "Obj Type MAT",
+    SUBSTR(COALESCE(Timestamp, ''), 1, 7);
+"""
+
+# Summary of the events of every material, to find the materials whose events changed between two reads: counts and
+# sums over the rows of each material only. A change that leaves all of them equal goes unnoticed
+material_digest_query = events_query + """
+SELECT
+    "Obj Type MAT" AS material_number,
+    COUNT(*) AS events,
+    TOTAL(quantity_change) AS quantity,
+    TOTAL(quantity_change * JULIANDAY(Timestamp)) AS weighted_time,
+    TOTAL(JULIANDAY(Timestamp)) AS time,
+    MAX(Timestamp) AS last_time,
+    TOTAL(LENGTH(Activity)) AS activities,
+    TOTAL(COALESCE(JULIANDAY(Timestamp), 1) * (UNICODE("Obj Type PLA") + 31 * UNICODE(SUBSTR("Obj Type PLA", -1))
+          + 961 * LENGTH("Obj Type PLA"))) AS plants,
+    TOTAL("PO Document") + TOTAL("PO Item") AS purchase_orders,
+    TOTAL("SO Document") + TOTAL("SO Item") AS sales_orders,
+    TOTAL("Obj Type CUSTOMER") AS customers,
+    TOTAL("Obj Type SUPPLIER") AS suppliers
+FROM
+    AllEvents
+WHERE
+    "Obj Type MAT" IS NOT NULL
+GROUP BY
+    "Obj Type MAT";
+"""
+
+# Natural key columns of every object type, interned once into dense integer ids
+KEY_COLUMNS = {
+    "MAT": ["Obj Type MAT"],
+    "PLA": ["Obj Type PLA"],
+    "PO_ITEM": ["PO Document", "PO Item"],
+    "SO_ITEM": ["SO Document", "SO Item"],
+    "CUSTOMER": ["Obj Type CUSTOMER"],
+    "SUPPLIER": ["Obj Type SUPPLIER"],
+    "MAT_PLA": ["Obj Type MAT", "Obj Type PLA"],
+}
+
+
+def extract_event_log(db):
+    return read_sql(db, query)
+
+
+def extract_materials(db, materials):
+    # Same rows as extract_event_log for the given materials only
+    return read_sql(db, materials_query, {"materials": json.dumps([int(m) for m in materials])})
+
 
+def material_digests(db):
+    return read_sql(db, material_digest_query).set_index("material_number").sort_index()
+
+
+def month_partitions(first, last):
+    # [start, end) bounds; the first partition also takes events without a timestamp, the last is open-ended
+    months = pd.period_range(first[:7], last[:7], freq="M").strftime("%Y-%m-01").tolist()
+    return list(zip([""] + months[1:], months[1:] + ["9999"]))
+
+
+def opening_balances(monthly, starts):
+    # Stock of every material before each partition start: a cumulative sum over the months. Materials without
+    # earlier events are left out, so that their first event keeps an unknown stock before, as in the single query
+    amounts = monthly.pivot_table(index="material_number", columns="month", values="quantity_change",
+                                  aggfunc="sum", fill_value=0).sort_index(axis=1).cumsum(axis=1)
+    seen = monthly.pivot_table(index="material_number", columns="month", values="events",
+                               aggfunc="sum", fill_value=0).sort_index(axis=1).cumsum(axis=1) > 0
+    openings = []
+    for start in starts:
+        earlier = [m for m in amounts.columns if m < start[:7]]
+        if not earlier:
+            openings.append(pd.Series(dtype=np.float64))
+        else:
+            openings.append(amounts.loc[seen[earlier[-1]], earlier[-1]])
+    return openings
+
+
+def extract_partition(db_path, start, end, opening):
+    df = read_sql(db_path, partition_query, {"start": start, "end": end})
+    opening_stock = df["Obj Type MAT"].map(opening)
+    before = df.pop("partition_stock_before")
+    after = df.pop("partition_stock_after")
+    df["Stock Before"] = np.where(opening_stock.isna(), before, opening_stock + before.fillna(0))
+    df["Stock After"] = opening_stock.fillna(0) + after
+    return df
+
+
+def extract_event_log_partitioned(db, max_workers=None):
+    # db: a ConnectionPool or the path of the database, like read_sql; the workers open their own connections.
+    # One monthly aggregate gives the partition bounds and the opening stocks, then every worker reads one month.
+    # Not the default: it only pays off with several cores, on one core it is slower than extract_event_log
+    db_path = db.db_path if isinstance(db, ConnectionPool) else db
+    monthly = read_sql(db, monthly_query)
+    months = sorted(m for m in monthly["month"].unique() if m)
+    if not months:
+        return extract_event_log(db)
+    starts, ends = zip(*month_partitions(months[0], months[-1]))
+    openings = opening_balances(monthly, starts)
+    # Workers come from a clean server process rather than a fork of this one, as callers may run their own
+    # reader threads next to the extraction
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("forkserver")) as executor:
+        partitions = list(executor.map(extract_partition, repeat(db_path), starts, ends, openings))
+    # Back to the (material, timestamp) order of the single query, so that the event ids match
+    event_log = pd.concat(partitions, ignore_index=True)
+    return event_log.sort_values(["Obj Type MAT", "Timestamp"], kind="stable", na_position="first",
+                                 ignore_index=True)
+
+
+def build_event_log(event_log_df):
     event_log_df = event_log_df.dropna(subset=["Stock Before", "Stock After"])
 
+    registry = ObjectRegistry()
+    event_log_df = encode_event_log(event_log_df, registry, KEY_COLUMNS)
+
     stock_before_min = event_log_df.groupby("ocel:type:MAT_PLA")["Stock Before"].min().to_dict()
     stock_after_min = event_log_df.groupby("ocel:type:MAT_PLA")["Stock After"].min().to_dict()
     stock_min = {x: min(y, stock_after_min[x]) for x, y in stock_before_min.items()}
@@ -176,9 +352,33 @@ if __name__ == '__main__':
     event_log_df["Stock After"] = event_log_df["Stock Before"] + event_log_df["ocel:type:MAT_PLA"].map(adding_stock)
 
     event_log_df["ocel:eid"] = "e"+event_log_df.index.astype("string")
+    return event_log_df, registry
+
 
-    for col in event_log_df.columns:
-        if col.startswith("ocel:type"):
-            event_log_df[col] = event_log_df[col].apply(lambda x: fix_type_column(x, col))
+def compare_extractions(db_path, max_workers=None):
+    # Order-independent comparison of the partitioned extraction against the single query. Rows tied on
+    # (material, timestamp) come in whatever order SQLite returns them, so the events are compared as multisets
+    # and the event ids per (material, timestamp) group
+    logs = []
+    for event_log_df in [extract_event_log(db_path), extract_event_log_partitioned(db_path, max_workers)]:
+        df, registry = build_event_log(event_log_df)
+        logs.append(event_log_csv_frame(df, registry).astype(str))
+    full, partitioned = logs
+    columns = [c for c in full.columns if c != "ocel:eid"]
+    groups = ["ocel:type:MAT", "ocel:timestamp", "ocel:eid"]
+    exact = pd.merge(full, partitioned, how="inner", on=list(full.columns))
+    return {
+        "events": (len(full), len(partitioned)),
+        "identical events": full[columns].sort_values(columns, ignore_index=True).equals(
+            partitioned[columns].sort_values(columns, ignore_index=True)),
+        "identical event ids per material and timestamp": full[groups].sort_values(groups, ignore_index=True).equals(
+            partitioned[groups].sort_values(groups, ignore_index=True)),
+        "events with the same id": len(exact),
+    }
+
+
+if __name__ == '__main__':
+    event_log_df, registry = build_event_log(extract_event_log('inventory_management.db'))
 
-    event_log_df.to_csv("ocel_inventory_management.csv", index=False)
+    write_event_log_csv(event_log_df, registry, "ocel_inventory_management.csv")
+    write_event_store(event_log_df, registry, "ocel_inventory_management.store")
@@ -1,9 +1,18 @@
-import sqlite3
+import importlib
+from statistics import NormalDist
+import numpy as np
 import pandas as pd
+from db_access import ConnectionPool, read_sql, run_concurrently
+from object_registry import write_event_log_csv
 
 
 query = """
-WITH MaterialsPlants AS (
+WITH DataWindow AS (
+    -- The last year of the data, up to the latest posting, rather than up to today
+    SELECT DATE(MAX(date_of_the_posting_in_the_document), '-1 year') AS window_start FROM GoodsReceiptsAndIssues
+),
+
+MaterialsPlants AS (
     -- List all unique combinations of material and plant
     SELECT DISTINCT material_number, plant FROM PurchaseOrderItems
     UNION
@@ -25,13 +34,29 @@ DailyDemand AS (
         GoodsReceiptsAndIssues gri
     WHERE
         gri.movement_type = 'Goods Issue'
-        AND gri.date_of_the_posting_in_the_document >= DATE('now', '-1 year')
+        AND gri.date_of_the_posting_in_the_document >= (SELECT window_start FROM DataWindow)
     GROUP BY
         gri.material_number,
         gri.plant,
         DATE(gri.date_of_the_posting_in_the_document)
 ),
 
+SalesValue AS (
+    -- Consumption value of the sales orders of the last year, the ABC criterion
+    SELECT
+        soi.material_number,
+        soi.plant,
+        SUM(soi.net_price * soi.order_quantity) AS consumption_value
+    FROM
+        SalesOrderItems soi
+    JOIN SalesOrderDocuments sod ON soi.sales_document_number = sod.sales_document_number
+    WHERE
+        sod.document_creation_date >= (SELECT window_start FROM DataWindow)
+    GROUP BY
+        soi.material_number,
+        soi.plant
+),
+
 AnnualDemand AS (
     -- Aggregate daily demand to compute annual demand and statistics
     SELECT
@@ -42,7 +67,8 @@ AnnualDemand AS (
         COUNT(DISTINCT dd.demand_date) AS days_with_demand,
         -- Calculate variance and standard deviation
         (AVG(dd.daily_quantity * dd.daily_quantity) - AVG(dd.daily_quantity) * AVG(dd.daily_quantity)) AS variance_daily_demand,
-        SQRT(AVG(dd.daily_quantity * dd.daily_quantity) - AVG(dd.daily_quantity) * AVG(dd.daily_quantity)) AS stddev_daily_demand
+        SQRT(AVG(dd.daily_quantity * dd.daily_quantity) - AVG(dd.daily_quantity) * AVG(dd.daily_quantity)) AS stddev_daily_demand,
+        SUM(dd.daily_quantity * dd.daily_quantity) AS sum_squared_daily_demand
     FROM
         MaterialsPlants mp
     LEFT JOIN
@@ -73,7 +99,7 @@ LeadTimes AS (
                 gri.movement_type = 'Goods Receipt'
                 AND pod.purchase_order_date IS NOT NULL
                 AND gri.date_of_the_posting_in_the_document IS NOT NULL
-                AND gri.date_of_the_posting_in_the_document >= DATE('now', '-1 year')
+                AND gri.date_of_the_posting_in_the_document >= (SELECT window_start FROM DataWindow)
         ) t
     WHERE
         t.LeadTimeDays >= 0  -- Exclude negative lead times
@@ -93,14 +119,18 @@ Calculations AS (
         COALESCE(NULLIF(ad.stddev_daily_demand, 0), COALESCE(ad.average_daily_demand, 1.0) * 0.1) AS stddev_daily_demand,
         -- Handle missing or negative lead time
         COALESCE(NULLIF(lt.average_lead_time, 0), 7.0) AS average_lead_time,
-        -- Constants
-        100.0 AS fixed_order_cost,  -- S
-        10.0 AS holding_cost_per_unit_per_year,  -- H
-        1.645 AS z_score  -- z (for 95% service level)
+        COALESCE(sv.consumption_value, 0) AS consumption_value,
+        -- Coefficient of variation of the daily demand over all 365 days, days without demand included
+        CASE WHEN ad.annual_demand > 0 THEN
+            SQRT(MAX(ad.sum_squared_daily_demand / 365.0 - (ad.annual_demand / 365.0) * (ad.annual_demand / 365.0), 0))
+            / (ad.annual_demand / 365.0)
+        END AS demand_cv
     FROM
         MaterialsPlants mp
     LEFT JOIN
         AnnualDemand ad ON mp.material_number = ad.material_number AND mp.plant = ad.plant
+    LEFT JOIN
+        SalesValue sv ON mp.material_number = sv.material_number AND mp.plant = sv.plant
     LEFT JOIN
         LeadTimes lt ON mp.material_number = lt.material_number AND mp.plant = lt.plant
 )
@@ -112,12 +142,8 @@ SELECT
     c.average_daily_demand AS "Average Daily Demand (d_m)",
     c.stddev_daily_demand AS "Std Dev of Daily Demand (σ_m)",
     c.average_lead_time AS "Average Lead Time (l_m)",
-    -- Calculate EOQ, handling cases where annual demand is zero
-    ROUND(CASE WHEN c.annual_demand > 0 THEN SQRT((2 * c.annual_demand * c.fixed_order_cost) / c.holding_cost_per_unit_per_year) ELSE 0 END, 2) AS "EOQ",
-    -- Calculate Safety Stock (SS)
-    ROUND(c.z_score * c.stddev_daily_demand * SQRT(c.average_lead_time), 2) AS "Safety Stock (SS)",
-    -- Calculate Reorder Point (ROP)
-    ROUND((c.average_daily_demand * c.average_lead_time) + (c.z_score * c.stddev_daily_demand * SQRT(c.average_lead_time)), 2) AS "Reorder Point (ROP)"
+    c.consumption_value AS "Consumption Value",
+    c.demand_cv AS "Demand CV"
 FROM
     Calculations c
 ORDER BY
@@ -126,140 +152,179 @@ ORDER BY
 """
 
 
-def calculate_inventory_parameters(db_path):
-    conn = sqlite3.connect(db_path)
-    results = pd.read_sql_query(query, conn)
-    conn.close()
-    return results
-
-
-def fix_type_column(x, col):
-    if x is None or pd.isna(x):
-        return x
-    elif x.startswith("["):
-        return eval(x)
-    else:
-        return [x]
-
-
-if __name__ == '__main__':
-    df1 = calculate_inventory_parameters('inventory_management.db')
-    df2 = pd.read_csv("ocel_inventory_management.csv")
-
-    df2["ocel:type:MAT"] = df2["ocel:type:MAT"].apply(lambda x: x.split('\'')[1])
-    df2["ocel:type:PLA"] = df2["ocel:type:PLA"].apply(lambda x: x.split('\'')[1])
-
-    df1["Material Number"] = "MAT-"+df1["Material Number"].astype("string")
-
-    # Step 1: Merge the DataFrames
-    df1_renamed = df1.rename(columns={
-        'Material Number': 'ocel:type:MAT',
-        'Plant': 'ocel:type:PLA'
-    })
-
-    df_merged = pd.merge(df2, df1_renamed, on=['ocel:type:MAT', 'ocel:type:PLA'], how='left')
+# Cumulative share of the consumption value up to which a material/plant is A or B, the rest is C
+ABC_SHARES = {"A": 0.8, "B": 0.95}
+
+# Coefficient of variation of the daily demand up to which a material/plant is X or Y, the rest is Z
+XYZ_CV = {"X": 0.5, "Y": 1.0}
+
+# Order and holding costs are the same for every segment: only the service level, and with it z, varies
+FIXED_ORDER_COST = 100.0  # S
+HOLDING_COST = 10.0  # H, per unit per year
+
+# Segment: service level
+SEGMENT_POLICIES = {
+    "AX": 0.98, "AY": 0.97, "AZ": 0.95,
+    "BX": 0.97, "BY": 0.95, "BZ": 0.93,
+    "CX": 0.95, "CY": 0.92, "CZ": 0.90,
+}
+
+# Material/plants without sales value or without demand in the window are not segmented and keep the flat 95%
+UNSEGMENTED_SERVICE_LEVEL = 0.95
+
+
+def segment_skus(params):
+    # ABC: rank by consumption value, classified by the share of the total value ranked above each material/plant
+    value = params["Consumption Value"].to_numpy(dtype=np.float64)
+    order = np.argsort(-value, kind="stable")
+    total = value.sum()
+    share_above = np.ones(len(value))
+    if total > 0:
+        share_above[order] = (np.cumsum(value[order]) - value[order]) / total
+    abc = np.select([(value > 0) & (share_above < ABC_SHARES["A"]), (value > 0) & (share_above < ABC_SHARES["B"])],
+                    ["A", "B"], "C")
+    # XYZ: materials/plants without demand have no coefficient of variation and end up in Z (but stay unsegmented)
+    cv = params["Demand CV"].to_numpy(dtype=np.float64)
+    xyz = np.select([cv <= XYZ_CV["X"], cv <= XYZ_CV["Y"]], ["X", "Y"], "Z")
+    return abc, xyz
+
+
+def apply_segment_policies(params, policies=SEGMENT_POLICIES):
+    abc, xyz = segment_skus(params)
+    unsegmented = ((params["Consumption Value"].to_numpy(dtype=np.float64) <= 0)
+                   | params["Demand CV"].isna().to_numpy())
+    segments = np.where(unsegmented, None, np.char.add(abc, xyz).astype(object))
+    service_level = pd.Series(policies).reindex(segments).fillna(UNSEGMENTED_SERVICE_LEVEL).to_numpy()
+    z = np.array([NormalDist().inv_cdf(p) for p in service_level])
+
+    annual_demand = params["Annual Demand (D_m)"].to_numpy(dtype=np.float64)
+    safety_stock = z * params["Std Dev of Daily Demand (σ_m)"].to_numpy() * np.sqrt(
+        params["Average Lead Time (l_m)"].to_numpy())
+
+    result = params.copy()
+    result["ABC Class"] = abc
+    result["XYZ Class"] = xyz
+    result["Segment"] = segments
+    result["z-Score"] = z
+    # Calculate EOQ, handling cases where annual demand is zero
+    result["EOQ"] = np.round(np.where(annual_demand > 0, np.sqrt(2 * annual_demand * FIXED_ORDER_COST / HOLDING_COST), 0), 2)
+    result["Safety Stock (SS)"] = np.round(safety_stock, 2)
+    result["Reorder Point (ROP)"] = np.round(
+        params["Average Daily Demand (d_m)"].to_numpy() * params["Average Lead Time (l_m)"].to_numpy() + safety_stock, 2)
+    return result
+
+
+def calculate_inventory_parameters(db, policies=SEGMENT_POLICIES):
+    return apply_segment_policies(read_sql(db, query), policies)
+
+
+def transform_goods_receipt(row):
+    stock_before = row['Stock Before']
+    stock_after = row['Stock After']
+    SS = row['Safety Stock (SS)']
+    OS = row['OS']
+
+    if stock_before < SS:
+        if stock_after < SS:
+            return 'Goods Receipt (Understock to Understock)'
+        elif stock_after >= SS and stock_after < OS:
+            return 'Goods Receipt (Understock to Normal)'
+        elif stock_after >= OS:
+            return 'Goods Receipt (Understock to Overstock)'
+    elif stock_before >= SS and stock_before < OS:
+        if stock_after >= SS and stock_after < OS:
+            return 'Goods Receipt (Normal to Normal)'
+        elif stock_after >= OS:
+            return 'Goods Receipt (Normal to Overstock)'
+    elif stock_before >= OS:
+        if stock_after >= OS:
+            return 'Goods Receipt (Overstock to Overstock)'
+    return row['ocel:activity']
+
+
+def transform_goods_issue(row):
+    stock_before = row['Stock Before']
+    stock_after = row['Stock After']
+    SS = row['Safety Stock (SS)']
+    OS = row['OS']
+
+    if stock_before < SS:
+        if stock_after < SS:
+            return 'Goods Issue (Understock to Understock)'
+    elif stock_before >= SS and stock_before < OS:
+        if stock_after < SS:
+            return 'Goods Issue (Normal to Understock)'
+        elif stock_after >= SS and stock_after < OS:
+            return 'Goods Issue (Normal to Normal)'
+    elif stock_before >= OS:
+        if stock_after >= SS and stock_after < OS:
+            return 'Goods Issue (Overstock to Normal)'
+        elif stock_after >= OS:
+            return 'Goods Issue (Overstock to Overstock)'
+    return row['ocel:activity']
+
+
+def transform_create_sales_order_item(row):
+    stock_before = row['Stock Before']
+    stock_after = row['Stock After']
+    SS = row['Safety Stock (SS)']
+    OS = row['OS']
+
+    if stock_before <= SS and stock_after <= SS:
+        return 'Create Sales Order Item (Understock to Understock)'
+    elif stock_before >= SS and stock_before < OS and stock_after <= SS:
+        return 'Create Sales Order Item (Normal to Understock)'
+    elif stock_before > SS and stock_after <= SS:
+        return 'Create Sales Order Item (Overstock to Understock)'
+    elif stock_before >= SS and stock_before < OS and stock_after >= SS and stock_after < OS:
+        return 'Create Sales Order Item (Normal to Normal)'
+    elif stock_before >= OS and stock_after >= SS and stock_after < OS:
+        return 'Create Sales Order Item (Overstock to Normal)'
+    elif stock_before >= OS and stock_after >= OS:
+        return 'Create Sales Order Item (Overstock to Overstock)'
+    return row['ocel:activity']
+
+
+def transform_create_purchase_order_item(row):
+    stock_before = row['Stock Before']
+    SS = row['Safety Stock (SS)']
+    OS = row['OS']
+
+    if stock_before < SS:
+        return 'Create Purchase Order Item (Understock)'
+    elif stock_before >= SS and stock_before < OS:
+        return 'Create Purchase Order Item (Normal)'
+    elif stock_before >= OS:
+        return 'Create Purchase Order Item (Overstock)'
+    return row['ocel:activity']
+
+
+def transform_create_purchase_suggestion_item(row):
+    stock_before = row['Stock Before']
+    SS = row['Safety Stock (SS)']
+    OS = row['OS']
+
+    if stock_before < SS:
+        return 'Create Purchase Suggestion Item (Understock)'
+    elif stock_before >= SS and stock_before < OS:
+        return 'Create Purchase Suggestion Item (Normal)'
+    elif stock_before >= OS:
+        return 'Create Purchase Suggestion Item (Overstock)'
+    return row['ocel:activity']
+
+
+def classify_event_log(df2, df1, registry):
+    # Step 1: Merge the DataFrames on the interned material/plant object
+    df1["ocel:type:MAT_PLA"] = [registry.lookup("MAT_PLA", (m, p)) for m, p in
+                                zip(df1["Material Number"], df1["Plant"])]
+    df1_renamed = df1[df1["ocel:type:MAT_PLA"] >= 0].drop(columns=["Material Number", "Plant"])
+
+    df_merged = pd.merge(df2, df1_renamed, on=['ocel:type:MAT_PLA'], how='left')
 
     # Step 2: Compute Overstock (OS)
     df_merged['OS'] = df_merged['Safety Stock (SS)'] + df_merged['EOQ']
 
     # Step 3: Apply Transformation Rules
-
-    def transform_goods_receipt(row):
-        stock_before = row['Stock Before']
-        stock_after = row['Stock After']
-        SS = row['Safety Stock (SS)']
-        OS = row['OS']
-
-        if stock_before < SS:
-            if stock_after < SS:
-                return 'Goods Receipt (Understock to Understock)'
-            elif stock_after >= SS and stock_after < OS:
-                return 'Goods Receipt (Understock to Normal)'
-            elif stock_after >= OS:
-                return 'Goods Receipt (Understock to Overstock)'
-        elif stock_before >= SS and stock_before < OS:
-            if stock_after >= SS and stock_after < OS:
-                return 'Goods Receipt (Normal to Normal)'
-            elif stock_after >= OS:
-                return 'Goods Receipt (Normal to Overstock)'
-        elif stock_before >= OS:
-            if stock_after >= OS:
-                return 'Goods Receipt (Overstock to Overstock)'
-        return row['ocel:activity']
-
-
-    def transform_goods_issue(row):
-        stock_before = row['Stock Before']
-        stock_after = row['Stock After']
-        SS = row['Safety Stock (SS)']
-        OS = row['OS']
-
-        if stock_before < SS:
-            if stock_after < SS:
-                return 'Goods Issue (Understock to Understock)'
-        elif stock_before >= SS and stock_before < OS:
-            if stock_after < SS:
-                return 'Goods Issue (Normal to Understock)'
-            elif stock_after >= SS and stock_after < OS:
-                return 'Goods Issue (Normal to Normal)'
-        elif stock_before >= OS:
-            if stock_after >= SS and stock_after < OS:
-                return 'Goods Issue (Overstock to Normal)'
-            elif stock_after >= OS:
-                return 'Goods Issue (Overstock to Overstock)'
-        return row['ocel:activity']
-
-
-    def transform_create_sales_order_item(row):
-        stock_before = row['Stock Before']
-        stock_after = row['Stock After']
-        SS = row['Safety Stock (SS)']
-        OS = row['OS']
-
-        if stock_before <= SS and stock_after <= SS:
-            return 'Create Sales Order Item (Understock to Understock)'
-        elif stock_before >= SS and stock_before < OS and stock_after <= SS:
-            return 'Create Sales Order Item (Normal to Understock)'
-        elif stock_before > SS and stock_after <= SS:
-            return 'Create Sales Order Item (Overstock to Understock)'
-        elif stock_before >= SS and stock_before < OS and stock_after >= SS and stock_after < OS:
-            return 'Create Sales Order Item (Normal to Normal)'
-        elif stock_before >= OS and stock_after >= SS and stock_after < OS:
-            return 'Create Sales Order Item (Overstock to Normal)'
-        elif stock_before >= OS and stock_after >= OS:
-            return 'Create Sales Order Item (Overstock to Overstock)'
-        return row['ocel:activity']
-
-
-    def transform_create_purchase_order_item(row):
-        stock_before = row['Stock Before']
-        SS = row['Safety Stock (SS)']
-        OS = row['OS']
-
-        if stock_before < SS:
-            return 'Create Purchase Order Item (Understock)'
-        elif stock_before >= SS and stock_before < OS:
-            return 'Create Purchase Order Item (Normal)'
-        elif stock_before >= OS:
-            return 'Create Purchase Order Item (Overstock)'
-        return row['ocel:activity']
-
-
-    def transform_create_purchase_suggestion_item(row):
-        stock_before = row['Stock Before']
-        SS = row['Safety Stock (SS)']
-        OS = row['OS']
-
-        if stock_before < SS:
-            return 'Create Purchase Suggestion Item (Understock)'
-        elif stock_before >= SS and stock_before < OS:
-            return 'Create Purchase Suggestion Item (Normal)'
-        elif stock_before >= OS:
-            return 'Create Purchase Suggestion Item (Overstock)'
-        return row['ocel:activity']
-
-
-    # Apply transformations
     df_merged['Transformed Activity'] = df_merged.apply(
         lambda row: transform_goods_receipt(row) if row['ocel:activity'] == 'Goods Receipt' else
         transform_goods_issue(row) if row['ocel:activity'] == 'Goods Issue' else
@@ -272,10 +337,21 @@ if __name__ == '__main__':
 
     # Update 'ocel:activity' in df2
     df2_updated = df2.copy()
-    df2_updated['ocel:activity'] = df_merged['Transformed Activity']
+    df2_updated['ocel:activity'] = df_merged['Transformed Activity'].to_numpy()
+    return df2_updated
+
+
+if __name__ == '__main__':
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+
+    # The event log and the parameter queries read the database concurrently; the log stays in memory
+    pool = ConnectionPool('inventory_management.db')
+    try:
+        event_log_df, df1 = run_concurrently(pool, extraction.extract_event_log, calculate_inventory_parameters)
+    finally:
+        pool.close()
 
-    for col in df2_updated.columns:
-        if col.startswith("ocel:type"):
-            df2_updated[col] = df2_updated[col].apply(lambda x: fix_type_column(x, col))
+    df2, registry = extraction.build_event_log(event_log_df)
+    df2_updated = classify_event_log(df2, df1, registry)
 
-    df2_updated.to_csv("post_ocel_inventory_management.csv", index=False)
+    write_event_log_csv(df2_updated, registry, "post_ocel_inventory_management.csv")
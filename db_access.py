@@ -0,0 +1,65 @@
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+READ_PRAGMAS = {
+    "mmap_size": 268435456,  # 256 MB of the database file mapped into memory
+    "cache_size": -65536,  # 64 MB page cache per connection
+    "temp_store": "MEMORY",  # sorts and temporary b-trees of the large window queries stay in memory
+    "query_only": 1,
+}
+
+
+def open_read_connection(db_path, pragmas=None):
+    conn = sqlite3.connect("file:" + db_path + "?mode=ro", uri=True, check_same_thread=False)
+    for name, value in {**READ_PRAGMAS, **(pragmas or {})}.items():
+        conn.execute("PRAGMA %s = %s;" % (name, value))
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=4, pragmas=None):
+        # Read-only: the database file is never written; 01 switches it to WAL when it creates the tables
+        self.db_path = db_path
+        self._connections = queue.Queue()
+        for _ in range(size):
+            self._connections.put(open_read_connection(db_path, pragmas))
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    def read_sql(self, query, params=None):
+        import pandas as pd  # deferred: the validator and the CLI only need sqlite3
+        with self.connection() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def close(self):
+        for _ in range(self.size):
+            self._connections.get().close()
+
+
+def read_sql(source, query, params=None):
+    # source: a ConnectionPool, or the path of the database for a one-off read connection
+    if isinstance(source, ConnectionPool):
+        return source.read_sql(query, params)
+    import pandas as pd
+    conn = open_read_connection(source)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+
+def run_concurrently(pool, *tasks):
+    # tasks: callables taking the pool as their only argument, each run on its own thread
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = [executor.submit(task, pool) for task in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,121 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from object_registry import OBJECT_TYPES, ObjectRegistry
+from relationship_index import RelationshipIndex, build_relationship_index
+
+
+# Events are sorted by (material, plant, timestamp), so these object types occupy contiguous row ranges
+CONTIGUOUS_TYPES = ["MAT", "MAT_PLA"]
+
+VALUE_COLUMNS = {"Stock Before": "stock_before", "Stock After": "stock_after"}
+
+
+def run_bounds(codes, num_objects):
+    # (start, end) row range of every object id in an array where each object forms one run
+    bounds = np.zeros((num_objects, 2), dtype=np.int64)
+    if len(codes) == 0:
+        return bounds
+    starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1])))
+    ends = np.append(starts[1:], len(codes))
+    keep = codes[starts] >= 0
+    bounds[codes[starts][keep], 0] = starts[keep]
+    bounds[codes[starts][keep], 1] = ends[keep]
+    return bounds
+
+
+def write_event_store(df, registry, directory):
+    os.makedirs(directory, exist_ok=True)
+    timestamps = pd.to_datetime(df["ocel:timestamp"]).to_numpy().astype("datetime64[s]")
+    order = np.lexsort((timestamps, df["ocel:type:PLA"].to_numpy(), df["ocel:type:MAT"].to_numpy()))
+
+    activity = pd.Categorical(df["ocel:activity"])
+    np.save(os.path.join(directory, "activity.npy"), activity.codes.astype(np.int16)[order])
+    np.save(os.path.join(directory, "timestamp.npy"), timestamps[order])
+    np.save(os.path.join(directory, "eid.npy"), df.index.to_numpy().astype(np.int64)[order])
+    for col, name in VALUE_COLUMNS.items():
+        np.save(os.path.join(directory, name + ".npy"), df[col].to_numpy().astype(np.float64)[order])
+
+    code_columns = {}
+    for obj_type in OBJECT_TYPES:
+        codes = df["ocel:type:" + obj_type].to_numpy().astype(np.int32)[order]
+        np.save(os.path.join(directory, obj_type + ".npy"), codes)
+        if obj_type in CONTIGUOUS_TYPES:
+            np.save(os.path.join(directory, obj_type + ".bounds.npy"), run_bounds(codes, len(registry)))
+        code_columns[obj_type] = codes
+
+    # Other object types are sliced through the object -> events lists, kept in timestamp order
+    event_order = np.argsort(timestamps[order], kind="stable")
+    build_relationship_index(code_columns, len(registry), event_order).save(directory)
+
+    registry.save(os.path.join(directory, "objects.json"))
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"num_events": int(len(df)), "activities": [str(x) for x in activity.categories],
+                   "contiguous_types": CONTIGUOUS_TYPES}, f)
+
+
+class EventStore:
+    def __init__(self, directory):
+        # Only the small metadata file is read here; columns are memory-mapped on first access
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.activities = np.array(self.meta["activities"], dtype=object)
+        self._arrays = {}
+        self._registry = None
+        self._relationships = None
+
+    def __len__(self):
+        return self.meta["num_events"]
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            self._registry = ObjectRegistry.load(os.path.join(self.directory, "objects.json"))
+        return self._registry
+
+    @property
+    def relationships(self):
+        if self._relationships is None:
+            self._relationships = RelationshipIndex.load(self.directory)
+        return self._relationships
+
+    def array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.directory, name + ".npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    def column_names(self):
+        return ["activity", "timestamp", "eid"] + list(VALUE_COLUMNS.values()) + OBJECT_TYPES
+
+    def object_id(self, obj_type, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        return self.registry.lookup(obj_type, key)
+
+    def object_rows(self, obj_type, oid):
+        # A slice for the sort-order types (zero-copy), an array of row positions for the others. MAT_PLA and the
+        # other types come in timestamp order; a MAT slice is ordered by plant first, then timestamp
+        if oid < 0:
+            return slice(0, 0)
+        if obj_type in self.meta["contiguous_types"]:
+            start, end = self.array(obj_type + ".bounds")[oid]
+            return slice(int(start), int(end))
+        return self.relationships.events_of(oid)
+
+    def events_of(self, obj_type, key, columns=None):
+        rows = self.object_rows(obj_type, self.object_id(obj_type, key))
+        return {name: self.array(name)[rows] for name in (columns or self.column_names())}
+
+    def to_dataframe(self, rows=slice(None)):
+        df = pd.DataFrame({
+            "ocel:activity": pd.Categorical.from_codes(self.array("activity")[rows], categories=self.activities),
+            "ocel:timestamp": self.array("timestamp")[rows],
+        })
+        for obj_type in OBJECT_TYPES:
+            df["ocel:type:" + obj_type] = self.array(obj_type)[rows]
+        for col, name in VALUE_COLUMNS.items():
+            df[col] = self.array(name)[rows]
+        df.index = self.array("eid")[rows]
+        return df
@@ -0,0 +1,208 @@
+import argparse
+import csv
+import importlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+# Only the standard library is imported here: pandas, numpy and the numbered scripts are loaded inside the
+# subcommands that need them, so that --help and the light subcommands start fast.
+
+DEFAULT_DB = "inventory_management.db"
+STARTUP_BUDGET_MS = 200.0
+STARTUP_COMMANDS = [["--help"], ["export", "--help"], ["export", "--summary"], ["validate"]]
+
+
+def generate(args):
+    generator = importlib.import_module("01_generate_simulation")
+    conn = sqlite3.connect(args.db)
+    generator.create_tables(conn)
+    generator.populate_tables(conn)
+    conn.close()
+    print("Database '%s' created and populated with simulated data." % args.db)
+
+
+def extract(args):
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+    from event_store import write_event_store
+    from object_registry import write_event_log_csv
+
+    if args.partitioned:
+        event_log_df = extraction.extract_event_log_partitioned(args.db, args.workers)
+    else:
+        event_log_df = extraction.extract_event_log(args.db)
+    event_log_df, registry = extraction.build_event_log(event_log_df)
+    write_event_log_csv(event_log_df, registry, args.output)
+    write_event_store(event_log_df, registry, args.output.rsplit(".", 1)[0] + ".store")
+    print(args.output)
+
+
+def parameters(args):
+    classification = importlib.import_module("04_postprocess_activities")
+    params = classification.calculate_inventory_parameters(args.db)
+    if args.material is not None:
+        params = params[params["Material Number"] == args.material]
+    if args.plant is not None:
+        params = params[params["Plant"] == args.plant]
+    if args.output:
+        params.to_csv(args.output, index=False)
+    print(params.to_string(index=False))
+
+
+def classify(args):
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+    classification = importlib.import_module("04_postprocess_activities")
+    from db_access import ConnectionPool, run_concurrently
+    from object_registry import write_event_log_csv
+
+    pool = ConnectionPool(args.db)
+    try:
+        event_log_df, params = run_concurrently(pool, extraction.extract_event_log,
+                                                classification.calculate_inventory_parameters)
+    finally:
+        pool.close()
+    df, registry = extraction.build_event_log(event_log_df)
+    write_event_log_csv(classification.classify_event_log(df, params, registry), registry, args.output)
+    print(args.output)
+
+
+def summarize(path):
+    # The counts 03 and 05 print through pm4py, from a stream over the CSV and the registry sidecar only
+    events, activities = 0, set()
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        labels = {col: set() for col in reader.fieldnames if col.startswith("ocel:type:")}
+        for row in reader:
+            events += 1
+            activities.add(row["ocel:activity"])
+            for col, values in labels.items():
+                if row[col]:
+                    values.add(row[col])
+    objects = {col[len("ocel:type:"):]: len(values) for col, values in labels.items()}
+    sidecar = path.rsplit(".", 1)[0] + ".objects.json"
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            types = json.load(f)["types"]
+        objects = {obj_type: types.count(obj_type) for obj_type in dict.fromkeys(types)}
+    print("events: %d, activities: %d" % (events, len(activities)))
+    for obj_type, count in objects.items():
+        print("%-9s %d objects" % (obj_type, count))
+
+
+def export(args):
+    if args.summary:
+        return summarize(args.input)
+    from object_registry import read_event_log_csv
+    from ocel_export import export_log, load_object_attributes
+
+    df, registry = read_event_log_csv(args.input)
+    materials, params = load_object_attributes(args.db) if os.path.exists(args.db) else (None, None)
+    base_path = args.output or args.input.rsplit(".", 1)[0]
+    for path in export_log(df, registry, base_path, args.formats.split(","), args.compression,
+                           materials=materials, parameters=params):
+        print(path)
+
+
+def validate(args):
+    from validate_database import print_report, validate_database
+
+    report = validate_database(args.db, workers=args.workers)
+    print_report(report)
+    return 1 if any(r["violations"] and r["severity"] == "error" for r in report) else 0
+
+
+def check_extract(args):
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+
+    result = extraction.compare_extractions(args.db, args.workers)
+    for name, value in result.items():
+        print("%-48s %s" % (name, value))
+    return 0 if result["identical events"] and result["identical event ids per material and timestamp"] else 1
+
+
+def measure_startup(command, runs):
+    # Wall time of fresh interpreters, which is what a user waits for
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        stderr = subprocess.run([sys.executable, os.path.abspath(__file__), *command], stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True).stderr
+        timings.append((time.perf_counter() - start) * 1000.0)
+    # A non-zero exit is a result (validate reports violations that way); only a traceback is a failure
+    return sorted(timings)[len(timings) // 2], "Traceback" in stderr
+
+
+def startup(args):
+    # --help exits in argparse; export --summary and validate run for real on the default files
+    failed = 0
+    for command in STARTUP_COMMANDS:
+        median, crashed = measure_startup(command, args.runs)
+        status = "FAILED" if crashed else "OK" if median <= args.budget else "SLOW"
+        failed += status != "OK"
+        print("%-8s %7.1f ms  %s" % (status, median, " ".join(command)))
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="inventory_cli", description="Inventory management simulation pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sub = subparsers.add_parser("generate", help="create and populate the simulation database (01)")
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.set_defaults(func=generate)
+
+    sub = subparsers.add_parser("extract", help="extract the OCEL CSV and the event store (02)")
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.add_argument("--output", default="ocel_inventory_management.csv")
+    sub.add_argument("--partitioned", action="store_true", help="one query per month on a process pool")
+    sub.add_argument("--workers", type=int, default=None)
+    sub.set_defaults(func=extract)
+
+    sub = subparsers.add_parser("parameters", help="print the SS/EOQ/ROP parameters per material/plant (04)")
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.add_argument("--material", type=int, default=None)
+    sub.add_argument("--plant", default=None)
+    sub.add_argument("--output", default=None)
+    sub.set_defaults(func=parameters)
+
+    sub = subparsers.add_parser("classify", help="extract and classify the activities by stock band (04)")
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.add_argument("--output", default="post_ocel_inventory_management.csv")
+    sub.set_defaults(func=classify)
+
+    sub = subparsers.add_parser("export", help="write an OCEL CSV as OCEL 2.0 XML, JSON and SQLite")
+    sub.add_argument("input", nargs="?", default="post_ocel_inventory_management.csv")
+    sub.add_argument("--formats", default="xml,json,sqlite")
+    sub.add_argument("--compression", choices=["gzip", "xz"], default=None)
+    sub.add_argument("--output", default=None)
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.add_argument("--summary", action="store_true", help="only print the number of events and objects")
+    sub.set_defaults(func=export)
+
+    sub = subparsers.add_parser("validate", help="check the referential integrity of the database")
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.add_argument("--workers", type=int, default=4)
+    sub.set_defaults(func=validate)
+
+    sub = subparsers.add_parser("check-extract", help="compare the partitioned extraction with the single query (02)")
+    sub.add_argument("--db", default=DEFAULT_DB)
+    sub.add_argument("--workers", type=int, default=None)
+    sub.set_defaults(func=check_extract)
+
+    sub = subparsers.add_parser("startup", help="measure the start-up time of the CLI against a budget")
+    sub.add_argument("--runs", type=int, default=5)
+    sub.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS, help="milliseconds")
+    sub.set_defaults(func=startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import importlib
+import itertools
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from db_access import ConnectionPool, read_sql, run_concurrently
+
+
+vendor_query = """
+WITH VendorLines AS (
+    -- Purchase order lines of each material/plant per vendor
+    SELECT
+        poi.material_number,
+        poi.plant,
+        pod.account_number_of_vendor AS vendor,
+        COUNT(*) AS lines
+    FROM
+        PurchaseOrderItems poi
+    INNER JOIN PurchaseOrderDocuments pod ON poi.purchase_order_number = pod.purchase_document_number
+    WHERE
+        poi.material_number IS NOT NULL AND pod.account_number_of_vendor IS NOT NULL
+    GROUP BY
+        poi.material_number,
+        poi.plant,
+        pod.account_number_of_vendor
+),
+
+MainVendor AS (
+    -- The vendor a material/plant is ordered from most often
+    SELECT
+        material_number,
+        plant,
+        vendor,
+        ROW_NUMBER() OVER (PARTITION BY material_number, plant ORDER BY lines DESC, vendor) AS vendor_rank
+    FROM
+        VendorLines
+)
+
+SELECT
+    mv.material_number AS "Material Number",
+    mv.plant AS "Plant",
+    mv.vendor AS "Vendor",
+    COALESCE(m.gross_weight, 0) AS "Gross Weight",
+    COALESCE(m.volume, 0) AS "Volume"
+FROM
+    MainVendor mv
+LEFT JOIN
+    Materials m ON mv.material_number = m.material_number
+WHERE
+    mv.vendor_rank = 1
+ORDER BY
+    mv.vendor,
+    mv.material_number,
+    mv.plant;
+"""
+
+# S and H are those of the EOQ in 04
+inventory_parameters = importlib.import_module("04_postprocess_activities")
+MAJOR_ORDER_COST = inventory_parameters.FIXED_ORDER_COST  # S, shared by all materials of one vendor order
+MINOR_ORDER_COST = 10.0  # s_i, added for every material included in the order
+HOLDING_COST = inventory_parameters.HOLDING_COST  # H, per unit per year
+TRUCK_WEIGHT = 24000.0  # kg per order
+TRUCK_VOLUME = 90.0  # m3 per order
+MAX_ITERATIONS = 100
+
+
+def best_multiples(hd, base_cycle, minor_cost):
+    # Best integer multiple for a fixed base cycle: largest k with k(k-1) <= 2 s_i / (h_i D_i T^2)
+    ratio = 2.0 * minor_cost / (hd * base_cycle ** 2)
+    return np.maximum(1.0, np.floor((1.0 + np.sqrt(1.0 + 4.0 * ratio)) / 2.0))
+
+
+def solve_vendor_group(demand, weight, volume, major_cost=MAJOR_ORDER_COST, minor_cost=MINOR_ORDER_COST,
+                       holding_cost=HOLDING_COST, weight_capacity=TRUCK_WEIGHT, volume_capacity=TRUCK_VOLUME):
+    # Joint replenishment with a base cycle T (years) and integer multiples k_i:
+    # material i is ordered every k_i * T with quantity D_i * k_i * T
+    k = np.ones(len(demand))
+    active = demand > 0
+    if not active.any():
+        return k, np.nan, 0.0
+    hd = holding_cost * demand[active]
+    weight_load = demand[active] * weight[active]
+    volume_load = demand[active] * volume[active]
+
+    def cycle(ka, capped=True):
+        # Optimal T for the multiples; capped: shortened so that the order where every material coincides fits
+        base_cycle = np.sqrt(2.0 * (major_cost + np.sum(minor_cost / ka)) / np.sum(hd * ka))
+        if capped and np.sum(weight_load * ka) > 0:
+            base_cycle = min(base_cycle, weight_capacity / np.sum(weight_load * ka))
+        if capped and np.sum(volume_load * ka) > 0:
+            base_cycle = min(base_cycle, volume_capacity / np.sum(volume_load * ka))
+        return base_cycle
+
+    def cost(ka, base_cycle):
+        return (major_cost + np.sum(minor_cost / ka)) / base_cycle + base_cycle / 2.0 * np.sum(hd * ka)
+
+    # Alternate between the best multiples for T and the best T for the multiples, once with the capacity cap
+    # inside the iteration and once without it (capping T only at the end), and keep the cheaper feasible result.
+    # A step is only taken while it lowers the cost, so the cap cannot drive the multiples up without bound.
+    # This is a heuristic: it reaches a good feasible solution, not necessarily the optimum under the capacity.
+    candidates = []
+    for capped in (True, False):
+        ka = np.ones(int(active.sum()))
+        base_cycle = cycle(ka, capped)
+        current = cost(ka, base_cycle)
+        for _ in range(MAX_ITERATIONS):
+            new_k = best_multiples(hd, base_cycle, minor_cost)
+            new_cycle = cycle(new_k, capped)
+            new_cost = cost(new_k, new_cycle)
+            if np.array_equal(new_k, ka) or new_cost >= current:
+                break
+            ka, base_cycle, current = new_k, new_cycle, new_cost
+        candidates.append((cost(ka, cycle(ka)), cycle(ka), ka))
+    best, base_cycle, ka = min(candidates, key=lambda c: c[0])
+    # When the capacity binds, the alternation stops short of the optimum: move single multiples up or down by
+    # one while that lowers the cost with the capped cycle
+    for _ in range(MAX_ITERATIONS):
+        neighbours = []
+        for i, step in itertools.product(range(len(ka)), (1, -1)):
+            if ka[i] + step >= 1:
+                neighbour = ka.copy()
+                neighbour[i] += step
+                neighbours.append((cost(neighbour, cycle(neighbour)), cycle(neighbour), neighbour))
+        if not neighbours or min(n[0] for n in neighbours) >= best:
+            break
+        best, base_cycle, ka = min(neighbours, key=lambda n: n[0])
+    k[active] = ka
+    return k, base_cycle, best
+
+
+def solve_vendor_groups(groups):
+    # groups: list of (demand, weight, volume) arrays, solved in one worker call to amortize the process overhead
+    return [solve_vendor_group(*g) for g in groups]
+
+
+def optimize_joint_replenishment(skus, max_workers=None, groups_per_task=256):
+    # skus: one row per material/plant with "Vendor", "Annual Demand (D_m)", "Gross Weight" and "Volume"
+    skus = skus.sort_values("Vendor", kind="stable", ignore_index=True)
+    _, starts = np.unique(skus["Vendor"].to_numpy(), return_index=True)
+    ends = np.append(starts[1:], len(skus))
+    demand = skus["Annual Demand (D_m)"].to_numpy(dtype=np.float64)
+    weight = skus["Gross Weight"].to_numpy(dtype=np.float64)
+    volume = skus["Volume"].to_numpy(dtype=np.float64)
+    groups = [(demand[s:e], weight[s:e], volume[s:e]) for s, e in zip(starts, ends)]
+    tasks = [groups[i:i + groups_per_task] for i in range(0, len(groups), groups_per_task)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        solutions = [solution for chunk in executor.map(solve_vendor_groups, tasks) for solution in chunk]
+
+    k = np.concatenate([s[0] for s in solutions]) if solutions else np.zeros(0)
+    sizes = ends - starts
+    base_cycle = np.repeat([s[1] for s in solutions], sizes)
+    cost = np.repeat([s[2] for s in solutions], sizes)
+
+    result = skus.copy()
+    result["Order Multiple (k)"] = k.astype(np.int64)
+    result["Base Cycle (days)"] = np.round(base_cycle * 365.0, 2)
+    # Materials without demand are never ordered: no order cycle
+    result["Order Cycle (days)"] = np.where(demand > 0, np.round(k * base_cycle * 365.0, 2), np.nan)
+    result["Order Quantity"] = np.round(demand * k * base_cycle, 2)
+    result["Vendor Annual Cost"] = np.round(cost, 2)
+    return result
+
+
+def load_skus(pool):
+    vendors, params = run_concurrently(pool, lambda p: read_sql(p, vendor_query),
+                                       inventory_parameters.calculate_inventory_parameters)
+    return pd.merge(vendors, params[["Material Number", "Plant", "Annual Demand (D_m)"]],
+                    on=["Material Number", "Plant"], how="left").fillna({"Annual Demand (D_m)": 0.0})
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'inventory_management.db'
+    pool = ConnectionPool(db_path)
+    skus = load_skus(pool)
+    pool.close()
+
+    result = optimize_joint_replenishment(skus)
+    result.to_csv("joint_replenishment.csv", index=False)
+    print(result)
@@ -0,0 +1,202 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+OBJECT_TYPES = ["MAT", "PLA", "PO_ITEM", "SO_ITEM", "CUSTOMER", "SUPPLIER", "MAT_PLA"]
+
+# Column order of the OCEL CSV written by 02 and 04
+CSV_COLUMNS = ["ocel:activity", "ocel:timestamp", "ocel:type:MAT", "ocel:type:PLA", "ocel:type:PO_ITEM",
+               "ocel:type:SO_ITEM", "ocel:type:CUSTOMER", "ocel:type:SUPPLIER", "Stock Before", "Stock After",
+               "ocel:type:MAT_PLA", "ocel:eid"]
+
+
+def format_object_id(obj_type, key):
+    if obj_type == "MAT":
+        return "MAT-" + str(key[0])
+    if obj_type == "PLA":
+        return str(key[0])
+    if obj_type == "MAT_PLA":
+        return "MAT-" + str(key[0]) + "_" + str(key[1])
+    return obj_type + "--" + "-".join(str(k) for k in key)
+
+
+def parse_object_id(obj_type, label):
+    # Inverse of format_object_id, for logs whose registry sidecar is missing
+    if obj_type == "MAT":
+        return (int(label[len("MAT-"):]),)
+    if obj_type == "PLA":
+        return (label,)
+    if obj_type == "MAT_PLA":
+        material, plant = label[len("MAT-"):].split("_", 1)
+        return (int(material), plant)
+    return tuple(int(k) if k.isdigit() else k for k in label[len(obj_type) + 2:].split("-"))
+
+
+def normalize_key_part(x):
+    if isinstance(x, (float, np.floating)) and float(x).is_integer():
+        return int(x)
+    if isinstance(x, np.integer):
+        return int(x)
+    return x
+
+
+class ObjectRegistry:
+    def __init__(self):
+        self.types = []
+        self.keys = []
+        self.index = {}
+        self._labels = None
+        self._label_index = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def intern(self, obj_type, key):
+        key = tuple(normalize_key_part(k) for k in key)
+        oid = self.index.get((obj_type, key))
+        if oid is None:
+            oid = len(self.keys)
+            self.index[(obj_type, key)] = oid
+            self.types.append(obj_type)
+            self.keys.append(key)
+            self._labels = None
+            self._label_index = None
+        return oid
+
+    def lookup(self, obj_type, key):
+        key = tuple(normalize_key_part(k) for k in key)
+        return self.index.get((obj_type, key), -1)
+
+    def intern_columns(self, obj_type, columns):
+        # Only the distinct keys go through Python; every event gets a take() on the int32 mapping
+        mask = np.logical_and.reduce([pd.Series(c).notna().to_numpy() for c in columns])
+        codes = np.full(len(mask), -1, dtype=np.int32)
+        if mask.any():
+            local, uniques = pd.MultiIndex.from_arrays([pd.Series(c).to_numpy()[mask] for c in columns]).factorize()
+            mapping = np.array([self.intern(obj_type, u) for u in uniques], dtype=np.int32)
+            codes[mask] = mapping[local]
+        return codes
+
+    def labels(self):
+        if self._labels is None:
+            self._labels = np.array([format_object_id(t, k) for t, k in zip(self.types, self.keys)], dtype=object)
+        return self._labels
+
+    def materialize(self, codes, as_list=True):
+        labels = self.labels()
+        if as_list:
+            labels = np.array(["['" + x + "']" for x in labels], dtype=object)
+        # Sentinel slot at the end so that missing objects (-1) materialize to None
+        labels = np.append(labels, None)
+        return labels[np.asarray(codes)]
+
+    def encode_labels(self, values):
+        if self._label_index is None:
+            self._label_index = {x: i for i, x in enumerate(self.labels())}
+        local, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        mapping = np.array([self._label_index.get(u[2:-2] if u.startswith("[") else u, -1) for u in uniques] + [-1],
+                           dtype=np.int32)
+        return mapping[local]
+
+    def codes_of_type(self, obj_type):
+        return np.flatnonzero(np.array(self.types, dtype=object) == obj_type).astype(np.int32)
+
+    def subset(self, oids):
+        # New registry with only the given objects (in their current order) and the old -> new code mapping;
+        # the extra last slot keeps the missing code -1 at -1
+        registry = ObjectRegistry()
+        mapping = np.full(len(self) + 1, -1, dtype=np.int32)
+        for oid in oids:
+            mapping[oid] = registry.intern(self.types[oid], self.keys[oid])
+        return registry, mapping
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"types": self.types, "keys": [list(k) for k in self.keys]}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            content = json.load(f)
+        registry = cls()
+        for obj_type, key in zip(content["types"], content["keys"]):
+            registry.intern(obj_type, key)
+        return registry
+
+
+def registry_path(csv_path):
+    return csv_path.rsplit(".", 1)[0] + ".objects.json"
+
+
+def encode_event_log(df, registry, key_columns):
+    # key_columns: object type -> list of natural key columns of df
+    encoded = pd.DataFrame(index=df.index)
+    encoded["ocel:activity"] = df["Activity"].astype("category")
+    encoded["ocel:timestamp"] = df["Timestamp"]
+    for obj_type, columns in key_columns.items():
+        encoded["ocel:type:" + obj_type] = registry.intern_columns(obj_type, [df[c] for c in columns])
+    for col in df.columns:
+        if col.startswith("Stock"):
+            encoded[col] = df[col]
+    return encoded
+
+
+def event_log_csv_frame(df, registry):
+    out = pd.DataFrame(index=df.index)
+    for col in CSV_COLUMNS:
+        if col.startswith("ocel:type:"):
+            out[col] = registry.materialize(df[col].to_numpy())
+        else:
+            out[col] = df[col]
+    return out
+
+
+def write_event_log_csv(df, registry, path):
+    event_log_csv_frame(df, registry).to_csv(path, index=False)
+    registry.save(registry_path(path))
+
+
+def registry_from_labels(df):
+    # The CSV labels are self-describing: intern the distinct ones of every object column in order of appearance
+    registry = ObjectRegistry()
+    for col in CSV_COLUMNS:
+        if col.startswith("ocel:type:") and col in df.columns:
+            obj_type = col[len("ocel:type:"):]
+            for label in pd.unique(df[col].dropna()):
+                label = label[2:-2] if label.startswith("[") else label
+                registry.intern(obj_type, parse_object_id(obj_type, label))
+    return registry
+
+
+def encode_object_columns(df, registry):
+    # Codes of every object column, or None if a label is not in the registry
+    codes = {}
+    for col in df.columns:
+        if col.startswith("ocel:type:"):
+            codes[col] = registry.encode_labels(df[col])
+            if ((codes[col] < 0) & df[col].notna().to_numpy()).any():
+                return None
+    return codes
+
+
+def read_event_log_csv(path, registry=None):
+    df = pd.read_csv(path)
+    if registry is not None:
+        codes = encode_object_columns(df, registry)
+        if codes is None:
+            raise ValueError("%s references objects that are not in the given registry" % path)
+    else:
+        codes = None
+        if os.path.exists(registry_path(path)):
+            registry = ObjectRegistry.load(registry_path(path))
+            codes = encode_object_columns(df, registry)
+        if codes is None:
+            # No sidecar, or a stale one left over from another run
+            registry = registry_from_labels(df)
+            codes = encode_object_columns(df, registry)
+    for col, values in codes.items():
+        df[col] = values
+    df["ocel:activity"] = df["ocel:activity"].astype("category")
+    return df, registry
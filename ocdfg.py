@@ -0,0 +1,55 @@
+import sys
+import numpy as np
+import pandas as pd
+from object_registry import OBJECT_TYPES, read_event_log_csv
+
+
+def event_sequence_numbers(df):
+    # Tie-breaker for events of one object sharing a timestamp
+    if "ocel:eid" in df.columns:
+        return df["ocel:eid"].astype("string").str[1:].astype(np.int64).to_numpy()
+    return df.index.to_numpy().astype(np.int64)
+
+
+def discover_ocdfg(df, object_types=None):
+    activity = pd.Categorical(df["ocel:activity"])
+    act = activity.codes.astype(np.int32)
+    labels = np.asarray(activity.categories, dtype=object)
+    ts = pd.to_datetime(df["ocel:timestamp"]).to_numpy().astype("datetime64[s]").astype(np.int64)
+    seq = event_sequence_numbers(df)
+
+    dfg = {}
+    for obj_type in (object_types or OBJECT_TYPES):
+        codes = df["ocel:type:" + obj_type].to_numpy()
+        rows = np.flatnonzero(codes >= 0)
+        rows = rows[np.lexsort((seq[rows], ts[rows], codes[rows]))]
+        obj = codes[rows]
+        same = obj[1:] == obj[:-1]
+        edges = pd.DataFrame({
+            "source": act[rows[:-1]][same],
+            "target": act[rows[1:]][same],
+            "object": obj[1:][same],
+            "duration": (ts[rows[1:]] - ts[rows[:-1]])[same].astype(np.float64),
+        })
+        stats = edges.groupby(["source", "target"]).agg(
+            frequency=("duration", "size"),
+            objects=("object", "nunique"),
+            duration_mean=("duration", "mean"),
+            duration_median=("duration", "median"),
+            duration_min=("duration", "min"),
+            duration_max=("duration", "max"),
+            duration_std=("duration", "std"),
+        ).reset_index()
+        stats["source"] = labels[stats["source"].to_numpy()]
+        stats["target"] = labels[stats["target"].to_numpy()]
+        dfg[obj_type] = stats.sort_values("frequency", ascending=False, ignore_index=True)
+    return dfg
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else "post_ocel_inventory_management.csv"
+    df, registry = read_event_log_csv(path)
+    for obj_type, stats in discover_ocdfg(df).items():
+        print(obj_type)
+        print(stats.to_string(index=False))
+        print()
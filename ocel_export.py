@@ -0,0 +1,372 @@
+import argparse
+import gzip
+import importlib
+import json
+import lzma
+import os
+import re
+import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+import pandas as pd
+from db_access import ConnectionPool, read_sql, run_concurrently
+from object_registry import OBJECT_TYPES, event_log_csv_frame, read_event_log_csv, registry_path
+from relationship_index import O2O_PAIRS, build_relationship_index
+
+
+EXTENSIONS = {"csv": ".csv", "xml": ".xml", "json": ".json", "sqlite": ".sqlite"}
+
+COMPRESSIONS = {"gzip": ".gz", "xz": ".xz"}
+
+CHUNK_SIZE = 10000
+
+# Time of the initial value of an object attribute
+INITIAL_TIME = "1970-01-01T00:00:00+00:00"
+
+OBJECT_ATTRIBUTES = {
+    "MAT": [("material_type", "string"), ("material_group", "string"), ("gross_weight", "float"),
+            ("net_weight", "float"), ("transport_group", "string")],
+    "MAT_PLA": [("stock_level", "float"), ("safety_stock", "float"), ("eoq", "float"), ("reorder_point", "float")],
+}
+
+PARAMETER_ATTRIBUTES = {"Safety Stock (SS)": "safety_stock", "EOQ": "eoq", "Reorder Point (ROP)": "reorder_point"}
+
+materials_query = """
+SELECT
+    material_number,
+    material_type,
+    material_group,
+    gross_weight,
+    net_weight,
+    transport_group
+FROM
+    Materials;
+"""
+
+
+def stock_level_changes(df, timestamps, times):
+    # Stock of each material/plant as a time series that only records the values that differ from the previous one
+    codes = df["ocel:type:MAT_PLA"].to_numpy()
+    rows = np.flatnonzero(codes >= 0)
+    rows = rows[np.lexsort((rows, timestamps[rows], codes[rows]))]
+    obj = codes[rows]
+    if len(obj) == 0:
+        return pd.DataFrame(columns=["oid", "time", "name", "value"])
+    before = df["Stock Before"].to_numpy(dtype=np.float64)[rows]
+    after = df["Stock After"].to_numpy(dtype=np.float64)[rows]
+    first = np.concatenate(([True], obj[1:] != obj[:-1]))
+    previous = np.concatenate(([np.nan], after[:-1]))
+    previous[first] = before[first]
+    changed = after != previous
+    return pd.concat([
+        pd.DataFrame({"oid": obj[first], "time": INITIAL_TIME, "name": "stock_level", "value": before[first]}),
+        pd.DataFrame({"oid": obj[changed], "time": times[rows][changed], "name": "stock_level",
+                      "value": after[changed]}),
+    ], ignore_index=True)
+
+
+def initial_values(oids, frame, columns):
+    keep = oids >= 0
+    wide = frame.loc[keep, list(columns)].rename(columns=columns).astype(object)
+    wide.insert(0, "oid", oids[keep])
+    values = wide.melt(id_vars="oid", var_name="name", value_name="value").dropna(subset=["value"])
+    values.insert(1, "time", INITIAL_TIME)
+    return values
+
+
+def object_attribute_changes(df, registry, timestamps, times, materials=None, parameters=None):
+    changes = [stock_level_changes(df, timestamps, times)]
+    if materials is not None:
+        oids = np.array([registry.lookup("MAT", (m,)) for m in materials["material_number"]], dtype=np.int64)
+        changes.append(initial_values(oids, materials, {name: name for name, kind in OBJECT_ATTRIBUTES["MAT"]}))
+    if parameters is not None:
+        oids = np.array([registry.lookup("MAT_PLA", (m, p)) for m, p in
+                         zip(parameters["Material Number"], parameters["Plant"])], dtype=np.int64)
+        changes.append(initial_values(oids, parameters, PARAMETER_ATTRIBUTES))
+    changes = pd.concat(changes, ignore_index=True)
+    return changes.sort_values(["oid", "time"], kind="stable", ignore_index=True)
+
+
+class ExportLog:
+    # Everything the writers need, computed once and only read (never copied) by the writer threads
+    def __init__(self, df, registry, materials=None, parameters=None):
+        self.df = df
+        self.registry = registry
+        timestamps = pd.to_datetime(df["ocel:timestamp"]).to_numpy().astype("datetime64[s]")
+        self.order = np.argsort(timestamps, kind="stable")
+        self.times = np.char.add(np.datetime_as_string(timestamps, unit="s"), "+00:00").astype(object)
+        if "ocel:eid" in df.columns:
+            self.event_ids = df["ocel:eid"].to_numpy(dtype=object)
+        else:
+            self.event_ids = np.array(["e" + str(x) for x in df.index], dtype=object)
+        activity = pd.Categorical(df["ocel:activity"])
+        self.activity_codes = activity.codes
+        self.activity_labels = [str(x) for x in activity.categories]
+
+        self.object_ids = registry.labels()
+        self.object_types = np.array(registry.types, dtype=object)
+        code_columns = {t: df["ocel:type:" + t].to_numpy() for t in OBJECT_TYPES}
+        self.relationships = build_relationship_index(code_columns, len(registry))
+
+        # One direction of each derived object-to-object link, e.g. PO_ITEM -> SUPPLIER
+        o2o_indptr = self.relationships.arrays["o2o.indptr"]
+        o2o_src = np.repeat(np.arange(len(registry)), np.diff(o2o_indptr))
+        o2o_dst = self.relationships.arrays["o2o.indices"]
+        keep = np.isin(self.object_types[o2o_src], [a for a, b in O2O_PAIRS])
+        self.o2o_src = o2o_src[keep]
+        self.o2o_dst = o2o_dst[keep]
+        self.o2o_indptr = np.zeros(len(registry) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.o2o_src, minlength=len(registry)), out=self.o2o_indptr[1:])
+
+        # Stock and parameters live on the MAT_PLA objects instead of being repeated on every event
+        changes = object_attribute_changes(df, registry, timestamps, self.times, materials, parameters)
+        self.change_oids = changes["oid"].to_numpy(dtype=np.int64)
+        self.change_times = changes["time"].to_numpy(dtype=object)
+        self.change_names = changes["name"].to_numpy(dtype=object)
+        self.change_values = changes["value"].to_numpy(dtype=object)
+        self.change_indptr = np.zeros(len(registry) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.change_oids, minlength=len(registry)), out=self.change_indptr[1:])
+
+    def event_objects(self, i):
+        return self.relationships.objects_of(i)
+
+    def related_objects(self, oid):
+        return self.o2o_dst[self.o2o_indptr[oid]:self.o2o_indptr[oid + 1]]
+
+    def attribute_changes(self, oid):
+        return range(self.change_indptr[oid], self.change_indptr[oid + 1])
+
+
+def attribute_value(value):
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    return value
+
+
+def open_output(path, compression):
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    if compression == "xz":
+        return lzma.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def type_map_name(name):
+    return re.sub(r"[^A-Za-z0-9]", "", name)
+
+
+def write_csv(log, path, compression):
+    with open_output(path, compression) as f:
+        event_log_csv_frame(log.df, log.registry).to_csv(f, index=False)
+    log.registry.save(registry_path(path[:len(path) - len(COMPRESSIONS.get(compression, ""))]))
+
+
+def write_chunked(f, pieces, separator=""):
+    buffer = []
+    first = True
+    for piece in pieces:
+        buffer.append(piece)
+        if len(buffer) >= CHUNK_SIZE:
+            f.write(("" if first else separator) + separator.join(buffer))
+            first = False
+            buffer = []
+    if buffer:
+        f.write(("" if first else separator) + separator.join(buffer))
+
+
+def xml_relationships(ids):
+    return "".join("        <relationship object-id=%s qualifier=\"\"/>\n" % x for x in ids)
+
+
+def xml_object_attributes(log, oid):
+    changes = log.attribute_changes(oid)
+    if not len(changes):
+        return "      <attributes/>\n"
+    return "      <attributes>\n%s      </attributes>\n" % "".join(
+        "        <attribute name=%s time=\"%s\">%s</attribute>\n" % (
+            quoteattr(log.change_names[c]), log.change_times[c], escape(str(attribute_value(log.change_values[c]))))
+        for c in changes)
+
+
+def xml_objects(log, object_attrs):
+    for oid in range(len(object_attrs)):
+        related = log.related_objects(oid)
+        yield "    <object id=%s type=%s>\n%s%s    </object>\n" % (
+            object_attrs[oid], quoteattr(log.object_types[oid]), xml_object_attributes(log, oid),
+            "      <objects>\n%s      </objects>\n" % xml_relationships(object_attrs[related]) if len(related) else "")
+
+
+def xml_events(log, object_attrs):
+    activity_attrs = [quoteattr(x) for x in log.activity_labels]
+    for i in log.order:
+        yield "    <event id=%s type=%s time=\"%s\">\n      <attributes/>\n" \
+              "      <objects>\n%s      </objects>\n    </event>\n" % (
+                  quoteattr(log.event_ids[i]), activity_attrs[log.activity_codes[i]], log.times[i],
+                  xml_relationships(object_attrs[log.event_objects(i)]))
+
+
+def write_xml(log, path, compression):
+    object_attrs = np.array([quoteattr(x) for x in log.object_ids], dtype=object)
+    with open_output(path, compression) as f:
+        f.write("<?xml version='1.0' encoding='UTF-8'?>\n<log>\n  <object-types>\n")
+        for obj_type in OBJECT_TYPES:
+            attributes = OBJECT_ATTRIBUTES.get(obj_type, [])
+            if attributes:
+                f.write("    <object-type name=%s>\n      <attributes>\n" % quoteattr(obj_type))
+                for name, kind in attributes:
+                    f.write("        <attribute name=%s type=\"%s\"/>\n" % (quoteattr(name), kind))
+                f.write("      </attributes>\n    </object-type>\n")
+            else:
+                f.write("    <object-type name=%s>\n      <attributes/>\n    </object-type>\n" % quoteattr(obj_type))
+        f.write("  </object-types>\n  <event-types>\n")
+        for activity in log.activity_labels:
+            f.write("    <event-type name=%s>\n      <attributes/>\n    </event-type>\n" % quoteattr(activity))
+        f.write("  </event-types>\n  <objects>\n")
+        write_chunked(f, xml_objects(log, object_attrs))
+        f.write("  </objects>\n  <events>\n")
+        write_chunked(f, xml_events(log, object_attrs))
+        f.write("  </events>\n</log>\n")
+
+
+def json_relationships(log, ids):
+    return [{"objectId": log.object_ids[x], "qualifier": ""} for x in ids]
+
+
+def json_object_attributes(log, oid):
+    return [{"name": log.change_names[c], "time": log.change_times[c], "value": attribute_value(log.change_values[c])}
+            for c in log.attribute_changes(oid)]
+
+
+def write_json(log, path, compression):
+    with open_output(path, compression) as f:
+        f.write('{"objectTypes": ')
+        json.dump([{"name": t, "attributes": [{"name": name, "type": kind}
+                                              for name, kind in OBJECT_ATTRIBUTES.get(t, [])]}
+                   for t in OBJECT_TYPES], f)
+        f.write(', "eventTypes": ')
+        json.dump([{"name": a, "attributes": []} for a in log.activity_labels], f)
+        f.write(', "objects": [')
+        write_chunked(f, (json.dumps({
+            "id": log.object_ids[oid], "type": log.object_types[oid],
+            "attributes": json_object_attributes(log, oid),
+            "relationships": json_relationships(log, log.related_objects(oid)),
+        }) for oid in range(len(log.object_ids))), ", ")
+        f.write('], "events": [')
+        write_chunked(f, (json.dumps({
+            "id": log.event_ids[i], "type": log.activity_labels[log.activity_codes[i]], "time": log.times[i],
+            "attributes": [],
+            "relationships": json_relationships(log, log.event_objects(i)),
+        }) for i in log.order), ", ")
+        f.write("]}\n")
+
+
+def sqlite_object_rows(log, obj_type):
+    # Initial values share one row per object; every later change gets its own row naming the changed field
+    names = [name for name, kind in OBJECT_ATTRIBUTES.get(obj_type, [])]
+    rows = []
+    for oid in np.flatnonzero(log.object_types == obj_type):
+        initial = [None] * len(names)
+        changes = []
+        for c in log.attribute_changes(oid):
+            position = names.index(log.change_names[c])
+            if log.change_times[c] == INITIAL_TIME:
+                initial[position] = attribute_value(log.change_values[c])
+            else:
+                values = [None] * len(names)
+                values[position] = attribute_value(log.change_values[c])
+                changes.append((log.object_ids[oid], log.change_times[c], log.change_names[c], *values))
+        rows.append((log.object_ids[oid], INITIAL_TIME, None, *initial))
+        rows += changes
+    return rows
+
+
+def write_sqlite(log, path, compression):
+    db_path = path[:len(path) - len(COMPRESSIONS[compression])] if compression else path
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("CREATE TABLE event (ocel_id TEXT PRIMARY KEY, ocel_type TEXT)")
+    cursor.execute("CREATE TABLE event_map_type (ocel_type TEXT, ocel_type_map TEXT)")
+    cursor.execute("CREATE TABLE object (ocel_id TEXT PRIMARY KEY, ocel_type TEXT)")
+    cursor.execute("CREATE TABLE object_map_type (ocel_type TEXT, ocel_type_map TEXT)")
+    cursor.execute("CREATE TABLE event_object (ocel_event_id TEXT, ocel_object_id TEXT, ocel_qualifier TEXT)")
+    cursor.execute("CREATE TABLE object_object (ocel_source_id TEXT, ocel_target_id TEXT, ocel_qualifier TEXT)")
+
+    cursor.executemany("INSERT INTO event_map_type VALUES (?, ?)",
+                       [(a, type_map_name(a)) for a in log.activity_labels])
+    for activity, code in zip(log.activity_labels, range(len(log.activity_labels))):
+        table = "event_" + type_map_name(activity)
+        cursor.execute('CREATE TABLE "%s" (ocel_id TEXT, ocel_time TIMESTAMP)' % table)
+        rows = log.order[log.activity_codes[log.order] == code]
+        cursor.executemany('INSERT INTO "%s" VALUES (?, ?)' % table, ((log.event_ids[i], log.times[i]) for i in rows))
+    cursor.executemany("INSERT INTO event VALUES (?, ?)",
+                       ((log.event_ids[i], log.activity_labels[log.activity_codes[i]]) for i in log.order))
+    cursor.executemany("INSERT INTO event_object VALUES (?, ?, '')",
+                       ((log.event_ids[i], log.object_ids[x]) for i in log.order for x in log.event_objects(i)))
+
+    cursor.executemany("INSERT INTO object_map_type VALUES (?, ?)", [(t, type_map_name(t)) for t in OBJECT_TYPES])
+    for obj_type in OBJECT_TYPES:
+        table = "object_" + type_map_name(obj_type)
+        attributes = OBJECT_ATTRIBUTES.get(obj_type, [])
+        columns = "".join(', "%s" %s' % (name, "REAL" if kind == "float" else "TEXT") for name, kind in attributes)
+        cursor.execute('CREATE TABLE "%s" (ocel_id TEXT, ocel_time TIMESTAMP, ocel_changed_field TEXT%s)'
+                       % (table, columns))
+        if attributes:
+            cursor.executemany('INSERT INTO "%s" VALUES (?, ?, ?%s)' % (table, ", ?" * len(attributes)),
+                               sqlite_object_rows(log, obj_type))
+    cursor.executemany("INSERT INTO object VALUES (?, ?)", zip(log.object_ids, log.object_types))
+    cursor.executemany("INSERT INTO object_object VALUES (?, ?, '')",
+                       zip(log.object_ids[log.o2o_src], log.object_ids[log.o2o_dst]))
+    conn.commit()
+    conn.close()
+
+    if compression:
+        with open(db_path, "rb") as src, (gzip.open if compression == "gzip" else lzma.open)(path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(db_path)
+
+
+WRITERS = {"csv": write_csv, "xml": write_xml, "json": write_json, "sqlite": write_sqlite}
+
+
+def load_object_attributes(db):
+    # Materials master data and the 04 parameters, read concurrently
+    parameters = importlib.import_module("04_postprocess_activities")
+    pool = ConnectionPool(db)
+    try:
+        return run_concurrently(pool, lambda p: read_sql(p, materials_query),
+                                parameters.calculate_inventory_parameters)
+    finally:
+        pool.close()
+
+
+def export_log(df, registry, base_path, formats=("csv", "xml", "json", "sqlite"), compression=None, max_workers=None,
+               materials=None, parameters=None):
+    log = ExportLog(df, registry, materials, parameters)
+    paths = [base_path + EXTENSIONS[fmt] + COMPRESSIONS.get(compression, "") for fmt in formats]
+    with ThreadPoolExecutor(max_workers=max_workers or len(formats)) as pool:
+        futures = [pool.submit(WRITERS[fmt], log, path, compression) for fmt, path in zip(formats, paths)]
+        for future in futures:
+            future.result()
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", nargs="?", default="post_ocel_inventory_management.csv")
+    parser.add_argument("--formats", default="xml,json,sqlite")
+    parser.add_argument("--compression", choices=list(COMPRESSIONS), default=None)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--db", default="inventory_management.db")
+    args = parser.parse_args()
+
+    df, registry = read_event_log_csv(args.input)
+    materials, parameters = load_object_attributes(args.db) if os.path.exists(args.db) else (None, None)
+    base_path = args.output or args.input.rsplit(".", 1)[0]
+    for path in export_log(df, registry, base_path, args.formats.split(","), args.compression,
+                           materials=materials, parameters=parameters):
+        print(path)
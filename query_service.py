@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from db_access import ConnectionPool, run_concurrently
+from event_store import run_bounds
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def evict(self, keys):
+        for key in keys:
+            self.entries.pop(key, None)
+
+
+def stock_band(stock, safety_stock, overstock):
+    # Same bands as the 04 classification: below SS, between SS and SS + EOQ, above
+    if np.isnan(safety_stock):
+        return None
+    if stock < safety_stock:
+        return "Understock"
+    if stock < overstock:
+        return "Normal"
+    return "Overstock"
+
+
+class ClassifiedLog:
+    # The classified log sorted by (material/plant, timestamp) with the 04 parameters aligned by object id.
+    # extracted (the rows of 02 before build_event_log), digests and df are kept for the incremental reload
+    def __init__(self, df, registry, parameters, extracted=None, digests=None):
+        self.df = df
+        self.extracted = extracted
+        self.digests = digests
+        self.registry = registry
+        self.parameters_df = parameters
+        codes = df["ocel:type:MAT_PLA"].to_numpy()
+        timestamps = pd.to_datetime(df["ocel:timestamp"]).to_numpy().astype("datetime64[s]")
+        order = np.lexsort((np.arange(len(df)), timestamps, codes))
+        self.codes = codes[order]
+        self.timestamps = timestamps[order]
+        self.activities = df["ocel:activity"].astype(str).to_numpy(dtype=object)[order]
+        self.event_ids = df["ocel:eid"].to_numpy(dtype=object)[order]
+        self.stock_before = df["Stock Before"].to_numpy(dtype=np.float64)[order]
+        self.stock_after = df["Stock After"].to_numpy(dtype=np.float64)[order]
+        self.bounds = run_bounds(self.codes, len(registry))
+
+        self.parameters = np.full((len(registry), 3), np.nan)
+        oids = np.array([registry.lookup("MAT_PLA", (m, p)) for m, p in
+                         zip(parameters["Material Number"], parameters["Plant"])], dtype=np.int64)
+        keep = oids >= 0
+        self.parameters[oids[keep]] = parameters.loc[keep, ["Safety Stock (SS)", "EOQ",
+                                                            "Reorder Point (ROP)"]].to_numpy(dtype=np.float64)
+
+    def object_id(self, material, plant):
+        return self.registry.lookup("MAT_PLA", (int(material), plant))
+
+    def fingerprints(self):
+        # Everything a cached view is made of, per material/plant natural key, to find the objects a reload changed
+        oids = self.registry.codes_of_type("MAT_PLA")
+        start, end = self.bounds[oids, 0], self.bounds[oids, 1]
+        last = np.maximum(end - 1, 0)
+        has_events = end > start
+        return pd.DataFrame({
+            "events": end - start,
+            "last_time": np.where(has_events, self.timestamps[last].astype(np.int64), -1),
+            "last_stock": np.where(has_events, self.stock_after[last], np.nan),
+            "safety_stock": self.parameters[oids, 0],
+            "eoq": self.parameters[oids, 1],
+            "reorder_point": self.parameters[oids, 2],
+        }, index=pd.MultiIndex.from_tuples([self.registry.keys[oid] for oid in oids]))
+
+    def view(self, oid):
+        start, end = self.bounds[oid]
+        safety_stock, eoq, reorder_point = self.parameters[oid]
+        stock = float(self.stock_after[end - 1]) if end > start else None
+        return {
+            "object": self.registry.labels()[oid],
+            "stock": stock,
+            "band": stock_band(stock, safety_stock, safety_stock + eoq) if stock is not None else None,
+            "as_of": str(self.timestamps[end - 1]) if end > start else None,
+            "safety_stock": None if np.isnan(safety_stock) else float(safety_stock),
+            "eoq": None if np.isnan(eoq) else float(eoq),
+            "reorder_point": None if np.isnan(reorder_point) else float(reorder_point),
+        }
+
+    def events(self, oid, since=None, until=None, limit=50):
+        # Row bounds always come from the current log: they shift whenever another object gains events
+        start, end = self.bounds[oid]
+        timestamps = self.timestamps[start:end]
+        lo = start + (np.searchsorted(timestamps, np.datetime64(since, "s"), "left") if since else 0)
+        hi = start + (np.searchsorted(timestamps, np.datetime64(until, "s"), "right") if until else end - start)
+        rows = range(hi - 1, max(lo, hi - limit) - 1, -1)
+        return [{"id": self.event_ids[i], "activity": self.activities[i], "time": str(self.timestamps[i]),
+                 "stock_before": float(self.stock_before[i]), "stock_after": float(self.stock_after[i])}
+                for i in rows]
+
+
+def changed_rows(old, new):
+    # Index entries whose row differs between the two frames, or that are only in one of them
+    old, new = old.align(new, join="outer")
+    same = ((old == new) | (old.isna() & new.isna())).all(axis=1)
+    return same.index[~same]
+
+
+def load_classified_log(db_path, previous=None):
+    # With a previous log, only the materials whose events changed are extracted again, and only the material/plants
+    # of those materials or with changed parameters are classified again; everything else is taken over
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+    classification = importlib.import_module("04_postprocess_activities")
+
+    def read_events(pool):
+        # The digests are read before the events: a write in between is seen as a change by the next reload
+        digests = extraction.material_digests(pool)
+        if previous is None:
+            return digests, digests.index, extraction.extract_event_log(pool)
+        changed = changed_rows(previous.digests, digests)
+        return digests, changed, extraction.extract_materials(pool, changed) if len(changed) else None
+
+    pool = ConnectionPool(db_path)
+    try:
+        (digests, changed, rows), parameters = run_concurrently(pool, read_events,
+                                                                classification.calculate_inventory_parameters)
+    finally:
+        pool.close()
+
+    if previous is None:
+        df, registry = extraction.build_event_log(rows)
+        df = classification.classify_event_log(df, parameters.copy(), registry)
+        return ClassifiedLog(df, registry, parameters, rows, digests)
+
+    keys = ["Material Number", "Plant"]
+    repriced = changed_rows(previous.parameters_df.set_index(keys)[["Safety Stock (SS)", "EOQ"]],
+                            parameters.set_index(keys)[["Safety Stock (SS)", "EOQ"]])
+    if not len(changed) and not len(repriced):
+        return previous
+
+    # Rows of 02 are ordered by material, and by timestamp within each material
+    kept = ~previous.extracted["Obj Type MAT"].isin(changed).to_numpy()
+    extracted = previous.extracted[kept]
+    if rows is not None:
+        extracted = pd.concat([extracted, rows]).infer_objects()
+    extracted = extracted.sort_values("Obj Type MAT", kind="stable", ignore_index=True)
+    df, registry = extraction.build_event_log(extracted)
+
+    # The rows of unchanged materials come out of build_event_log in the same order as before
+    materials = extracted.loc[df.index, "Obj Type MAT"].to_numpy()
+    previous_materials = previous.extracted.loc[previous.df.index, "Obj Type MAT"].to_numpy()
+    activities = df["ocel:activity"].to_numpy(dtype=object)
+    unchanged = ~np.isin(materials, changed)
+    activities[unchanged] = previous.df["ocel:activity"].to_numpy(dtype=object)[~np.isin(previous_materials, changed)]
+
+    pairs = pd.MultiIndex.from_arrays([materials, extracted.loc[df.index, "Obj Type PLA"].to_numpy()])
+    stale = ~unchanged | pairs.isin(repriced)
+    if stale.any():
+        activities[stale] = classification.classify_event_log(df[stale], parameters.copy(),
+                                                              registry)["ocel:activity"].to_numpy(dtype=object)
+    df["ocel:activity"] = activities
+    return ClassifiedLog(df, registry, parameters, extracted, digests)
+
+
+def database_version(db_path):
+    # Changes of the database file or of its write-ahead log
+    return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else 0 for p in [db_path, db_path + "-wal"])
+
+
+class QueryService:
+    def __init__(self, db_path, cache_size=4096, refresh_interval=5.0):
+        self.db_path = db_path
+        self.cache = LRUCache(cache_size)
+        self.refresh_interval = refresh_interval
+        self.version = database_version(db_path)
+        self.log = load_classified_log(db_path)
+
+    def object_view(self, material, plant):
+        # Views are cached by natural key, which unlike the object id survives a reload with a new registry
+        oid = self.log.object_id(material, plant)
+        if oid < 0:
+            return None, None
+        key = self.log.registry.keys[oid]
+        view = self.cache.get(key)
+        if view is None:
+            view = self.log.view(oid)
+            self.cache.put(key, view)
+        return oid, view
+
+    def replace_log(self, log):
+        # Evict only the cached objects whose view would differ in the new log
+        old, new = self.log.fingerprints(), log.fingerprints()
+        old, new = old.align(new, join="outer")
+        same = ((old == new) | (old.isna() & new.isna())).all(axis=1)
+        self.cache.evict(same.index[~same].tolist())
+        self.log = log
+
+    def handle(self, path, query):
+        if path == "/health":
+            return 200, {"status": "ok", "cache_entries": len(self.cache.entries), "cache_hits": self.cache.hits,
+                         "cache_misses": self.cache.misses}
+        if path not in ("/stock", "/parameters", "/events"):
+            return 404, {"error": "unknown path"}
+        try:
+            oid, view = self.object_view(query["material"][0], query["plant"][0])
+        except (KeyError, ValueError):
+            return 400, {"error": "material and plant are required"}
+        if view is None:
+            return 404, {"error": "unknown material/plant"}
+        if path == "/stock":
+            return 200, {k: view[k] for k in ("object", "stock", "band", "as_of", "safety_stock", "eoq",
+                                              "reorder_point")}
+        if path == "/parameters":
+            return 200, {k: view[k] for k in ("object", "safety_stock", "eoq", "reorder_point")}
+        since = query.get("since", [None])[0]
+        until = query.get("until", [None])[0]
+        limit = int(query.get("limit", [50])[0])
+        return 200, {"object": view["object"], "events": self.log.events(oid, since, until, limit)}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                    url = urlsplit(target)
+                    status, payload = self.handle(url.path, parse_qs(url.query))
+                except ValueError:
+                    status, payload = 400, {"error": "bad request"}
+                body = json.dumps(payload).encode()
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                             % (status, b"OK" if status == 200 else b"Error", len(body)) + body)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            version = database_version(self.db_path)
+            if version == self.version:
+                continue
+            # Off the event loop, and only for the materials that changed; event ids are renumbered over the whole
+            # log by build_event_log, as in a full reload
+            try:
+                log = await asyncio.get_running_loop().run_in_executor(None, load_classified_log, self.db_path,
+                                                                       self.log)
+            except Exception:
+                # Keep serving the current log; the version stays old, so the next tick tries again
+                logger.exception("reloading %s failed", self.db_path)
+                continue
+            self.replace_log(log)
+            self.version = version
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        refresh = asyncio.create_task(self.refresh_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresh.cancel()
+            await asyncio.gather(refresh, return_exceptions=True)
+
+
+async def run_client(host, port, targets, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    request_template = "GET %s HTTP/1.1\r\nHost: " + host + "\r\n\r\n"
+    for target in targets:
+        start = time.perf_counter()
+        writer.write((request_template % target).encode())
+        await writer.drain()
+        await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def load_test(service, clients=50, requests=200, host="127.0.0.1", port=0):
+    # Starts the service on an ephemeral port and hammers it with concurrent keep-alive clients
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    port = server.sockets[0].getsockname()[1]
+    registry = service.log.registry
+    pairs = [registry.keys[oid] for oid in registry.codes_of_type("MAT_PLA")]
+    rng = np.random.default_rng(0)
+    paths = ["/stock", "/events", "/parameters"]
+    latencies = []
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*[run_client(host, port, [
+            "%s?material=%s&plant=%s" % (paths[i % 3], *pairs[j]) for i, j in
+            enumerate(rng.integers(0, len(pairs), requests))], latencies) for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000.0
+    return {"requests": len(latencies), "seconds": elapsed, "throughput": len(latencies) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["serve", "bench"])
+    parser.add_argument("--db", default="inventory_management.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=4096)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    service = QueryService(args.db, cache_size=args.cache_size)
+    if args.command == "serve":
+        asyncio.run(service.serve(args.host, args.port))
+    else:
+        print(json.dumps(asyncio.run(load_test(service, args.clients, args.requests, args.host)), indent=2))
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+# Object-to-object links derived from co-occurrence in the same event
+O2O_PAIRS = [("PO_ITEM", "SUPPLIER"), ("SO_ITEM", "CUSTOMER"), ("MAT", "PLA")]
+
+RELATIONS = ["e2o", "o2e", "o2o"]
+
+
+def csr_from_pairs(src, dst, num_rows):
+    # Counting sort by src; pairs keep their input order within each row
+    src = np.asarray(src, dtype=np.int64)
+    counts = np.bincount(src, minlength=num_rows)
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    rank = pd.Series(src).groupby(src).cumcount().to_numpy()
+    indices = np.empty(len(src), dtype=np.int64)
+    indices[indptr[src] + rank] = dst
+    return indptr, indices
+
+
+class RelationshipIndex:
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def neighbours(self, relation, i):
+        indptr = self.arrays[relation + ".indptr"]
+        return self.arrays[relation + ".indices"][indptr[i]:indptr[i + 1]]
+
+    def objects_of(self, event_row):
+        return self.neighbours("e2o", event_row)
+
+    def events_of(self, oid):
+        return self.neighbours("o2e", oid)
+
+    def related_objects(self, oid):
+        return self.neighbours("o2o", oid)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, arr in self.arrays.items():
+            np.save(os.path.join(directory, name + ".npy"), arr)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        arrays = {}
+        for relation in RELATIONS:
+            for part in ["indptr", "indices"]:
+                name = relation + "." + part
+                arrays[name] = np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+        return cls(arrays)
+
+
+def build_relationship_index(code_columns, num_objects, event_order=None):
+    # code_columns: object type -> int32 object ids per event (-1 where the event has no such object)
+    types = list(code_columns)
+    matrix = np.column_stack([np.asarray(code_columns[t], dtype=np.int64) for t in types])
+    num_events = matrix.shape[0]
+    mask = matrix >= 0
+
+    e2o_indptr = np.zeros(num_events + 1, dtype=np.int64)
+    np.cumsum(mask.sum(axis=1), out=e2o_indptr[1:])
+    e2o_indices = matrix[mask]
+
+    # object -> events, each object's events listed in event_order (e.g. by timestamp)
+    if event_order is None:
+        event_order = np.arange(num_events)
+    ordered_mask = mask[event_order]
+    o2e_src = matrix[event_order][ordered_mask]
+    o2e_dst = np.repeat(event_order, ordered_mask.sum(axis=1))
+    o2e_indptr, o2e_indices = csr_from_pairs(o2e_src, o2e_dst, num_objects)
+
+    src, dst = [], []
+    for a, b in O2O_PAIRS:
+        if a not in code_columns or b not in code_columns:
+            continue
+        ca = matrix[:, types.index(a)]
+        cb = matrix[:, types.index(b)]
+        both = (ca >= 0) & (cb >= 0)
+        pairs = pd.unique(ca[both] * num_objects + cb[both])
+        src += [pairs // num_objects, pairs % num_objects]
+        dst += [pairs % num_objects, pairs // num_objects]
+    if src:
+        o2o_indptr, o2o_indices = csr_from_pairs(np.concatenate(src), np.concatenate(dst), num_objects)
+    else:
+        o2o_indptr, o2o_indices = np.zeros(num_objects + 1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    return RelationshipIndex({
+        "e2o.indptr": e2o_indptr, "e2o.indices": e2o_indices,
+        "o2e.indptr": o2e_indptr, "o2e.indices": o2e_indices,
+        "o2o.indptr": o2o_indptr, "o2o.indices": o2o_indices,
+    })
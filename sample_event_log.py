@@ -0,0 +1,89 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from object_registry import OBJECT_TYPES, read_event_log_csv
+from ocel_export import export_log, load_object_attributes
+
+
+BANDS = ["Understock", "Normal", "Overstock"]
+
+
+def event_bands(df):
+    # Band after each event from the 04 labels, e.g. "Goods Receipt (Understock to Normal)" -> Normal; -1 if unclassified
+    activity = pd.Categorical(df["ocel:activity"])
+    band = pd.Series(activity.categories).astype(str).str.extract(r"(\w+)\)$")[0]
+    mapping = np.append(band.map({b: i for i, b in enumerate(BANDS)}).fillna(-1).to_numpy(dtype=np.int64), -1)
+    return mapping[activity.codes]
+
+
+def pair_strata(df, registry, stratify=None, materials=None):
+    # Stratum of every material/plant object of the log, indexed by its object code
+    oids = registry.codes_of_type("MAT_PLA")
+    if stratify is None:
+        return pd.Series("all", index=oids)
+    if stratify == "material_group":
+        groups = materials.set_index("material_number")["material_group"]
+        return pd.Series([registry.keys[oid][0] for oid in oids], index=oids).map(groups).fillna("unknown")
+    # Band mix: the combination of bands a material/plant passes through, e.g. "Understock/Overstock"
+    codes = df["ocel:type:MAT_PLA"].to_numpy()
+    bands = event_bands(df)
+    keep = (codes >= 0) & (bands >= 0)
+    visited = np.zeros((len(registry), len(BANDS)), dtype=bool)
+    visited[codes[keep], bands[keep]] = True
+    mixes, inverse = np.unique(visited[oids], axis=0, return_inverse=True)
+    labels = np.array(["/".join(b for b, v in zip(BANDS, row) if v) or "unclassified" for row in mixes], dtype=object)
+    return pd.Series(labels[inverse.ravel()], index=oids)
+
+
+def sample_pairs(strata, fraction, seed=0):
+    # Random ranking within each stratum; the first ceil(fraction * size) objects of every stratum are kept
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({"stratum": strata.to_numpy(), "key": rng.random(len(strata))}, index=strata.index)
+    rank = frame.groupby("stratum")["key"].rank(method="first").to_numpy()
+    size = frame.groupby("stratum")["key"].transform("size").to_numpy()
+    return strata.index.to_numpy()[rank <= np.ceil(fraction * size)]
+
+
+def sample_event_log(df, registry, pairs):
+    # One pass over the events: keep those of the sampled material/plant objects, then every object they reference
+    selected = np.zeros(len(registry) + 1, dtype=bool)
+    selected[pairs] = True
+    sample = df[selected[df["ocel:type:MAT_PLA"].to_numpy()]].copy()
+    referenced = np.zeros(len(registry) + 1, dtype=bool)
+    for obj_type in OBJECT_TYPES:
+        referenced[sample["ocel:type:" + obj_type].to_numpy()] = True
+    sub_registry, mapping = registry.subset(np.flatnonzero(referenced[:-1]))
+    for obj_type in OBJECT_TYPES:
+        sample["ocel:type:" + obj_type] = mapping[sample["ocel:type:" + obj_type].to_numpy()]
+    return sample, sub_registry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", nargs="?", default="post_ocel_inventory_management.csv")
+    parser.add_argument("--fraction", type=float, default=0.1)
+    parser.add_argument("--stratify", choices=["material_group", "band"], default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--formats", default="csv,xml,json,sqlite")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--db", default="inventory_management.db")
+    args = parser.parse_args()
+    if not 0 < args.fraction <= 1:
+        parser.error("--fraction must be in (0, 1]")
+
+    df, registry = read_event_log_csv(args.input)
+    materials, parameters = load_object_attributes(args.db) if os.path.exists(args.db) else (None, None)
+    if args.stratify == "material_group" and materials is None:
+        parser.error("stratifying by material_group needs the database")
+
+    strata = pair_strata(df, registry, args.stratify, materials)
+    sample, sub_registry = sample_event_log(df, registry, sample_pairs(strata, args.fraction, args.seed))
+    print("%d of %d material/plant pairs, %d of %d events, %d of %d objects" % (
+        len(sub_registry.codes_of_type("MAT_PLA")), len(strata), len(sample), len(df), len(sub_registry),
+        len(registry)))
+
+    base_path = args.output or args.input.rsplit(".", 1)[0] + ".sample"
+    for path in export_log(sample, sub_registry, base_path, args.formats.split(","), materials=materials,
+                           parameters=parameters):
+        print(path)
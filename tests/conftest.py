@@ -0,0 +1,23 @@
+import importlib
+import os
+import random
+import sqlite3
+import sys
+import pytest
+
+# The pipeline modules live at the top level of the repository, several of them under numbered names
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def generated_db(tmp_path_factory):
+    # A fresh simulation database, as 01 creates it
+    generator = importlib.import_module("01_generate_simulation")
+    path = str(tmp_path_factory.mktemp("db") / "inventory_management.db")
+    random.seed(0)
+    conn = sqlite3.connect(path)
+    generator.create_tables(conn)
+    generator.populate_tables(conn)
+    conn.close()
+    return path
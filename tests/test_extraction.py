@@ -0,0 +1,16 @@
+import importlib
+
+
+def test_partitioned_extraction_matches_single_query(generated_db):
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+    result = extraction.compare_extractions(generated_db, max_workers=2)
+    assert result["events"][0] == result["events"][1] > 0
+    assert result["identical events"]
+    assert result["identical event ids per material and timestamp"]
+
+
+def test_month_partitions_cover_the_whole_range():
+    extraction = importlib.import_module("02_database_to_ocel_csv")
+    partitions = extraction.month_partitions("2023-09-14", "2023-12-01")
+    assert partitions[0][0] == "" and partitions[-1][1] == "9999"
+    assert all(end == start for (_, end), (start, _) in zip(partitions[:-1], partitions[1:]))
@@ -0,0 +1,42 @@
+import importlib
+import itertools
+import numpy as np
+import pytest
+
+jrp = importlib.import_module("joint_replenishment")
+
+
+def brute_force(demand, weight, volume, max_multiple=6):
+    # Every combination of multiples up to max_multiple, each with its best feasible base cycle: the cost is
+    # convex in T, so that is the unconstrained optimum shortened to the capacity
+    hd = jrp.HOLDING_COST * demand
+    best = np.inf
+    for k in itertools.product(range(1, max_multiple + 1), repeat=len(demand)):
+        k = np.array(k, dtype=np.float64)
+        setup = jrp.MAJOR_ORDER_COST + np.sum(jrp.MINOR_ORDER_COST / k)
+        base_cycle = min(np.sqrt(2.0 * setup / np.sum(hd * k)),
+                         jrp.TRUCK_WEIGHT / np.sum(demand * weight * k),
+                         jrp.TRUCK_VOLUME / np.sum(demand * volume * k))
+        best = min(best, setup / base_cycle + base_cycle / 2.0 * np.sum(hd * k))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("weight_scale", [1.0, 200.0])
+def test_solver_is_close_to_brute_force(seed, weight_scale):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 5))
+    demand = rng.uniform(1.0, 2000.0, n) * rng.choice([0.01, 1.0], n)
+    weight = rng.uniform(1.0, 100.0, n) * weight_scale
+    volume = rng.uniform(0.001, 0.05, n)
+
+    k, base_cycle, cost = jrp.solve_vendor_group(demand, weight, volume)
+    assert np.all(k >= 1) and np.array_equal(k, np.round(k))
+    assert np.sum(demand * weight * k) * base_cycle <= jrp.TRUCK_WEIGHT * (1 + 1e-9)
+    assert np.sum(demand * volume * k) * base_cycle <= jrp.TRUCK_VOLUME * (1 + 1e-9)
+    assert cost <= brute_force(demand, weight, volume) * 1.005
+
+
+def test_group_without_demand_is_never_ordered():
+    k, base_cycle, cost = jrp.solve_vendor_group(np.zeros(3), np.ones(3), np.ones(3))
+    assert np.all(k == 1) and np.isnan(base_cycle) and cost == 0.0
@@ -0,0 +1,46 @@
+import os
+import statistics
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import ROOT
+from object_registry import OBJECT_TYPES, read_event_log_csv
+from ocdfg import discover_ocdfg
+
+
+def per_object_dfg(df, obj_type):
+    # Reference: walk the events of every object in (timestamp, event id) order
+    events = defaultdict(list)
+    for _, row in df.iterrows():
+        if row["ocel:type:" + obj_type] >= 0:
+            events[row["ocel:type:" + obj_type]].append(
+                (pd.Timestamp(row["ocel:timestamp"]), int(row["ocel:eid"][1:]), str(row["ocel:activity"])))
+    durations, objects = defaultdict(list), defaultdict(set)
+    for obj, trace in events.items():
+        trace.sort()
+        for (t1, _, a1), (t2, _, a2) in zip(trace, trace[1:]):
+            durations[(a1, a2)].append((t2 - t1).total_seconds())
+            objects[(a1, a2)].add(obj)
+    return {edge: {"frequency": len(d), "objects": len(objects[edge]), "duration_mean": statistics.mean(d),
+                   "duration_median": statistics.median(d), "duration_min": min(d), "duration_max": max(d),
+                   "duration_std": statistics.stdev(d) if len(d) > 1 else np.nan}
+            for edge, d in durations.items()}
+
+
+@pytest.fixture(scope="module")
+def event_log():
+    df, _ = read_event_log_csv(os.path.join(ROOT, "post_ocel_inventory_management.csv"))
+    # Shuffled, so that the discovery cannot rely on the order of the file
+    return df.sample(frac=1.0, random_state=0)
+
+
+@pytest.mark.parametrize("obj_type", OBJECT_TYPES)
+def test_discover_ocdfg_matches_per_object_loop(event_log, obj_type):
+    stats = discover_ocdfg(event_log, [obj_type])[obj_type]
+    expected = per_object_dfg(event_log, obj_type)
+    assert len(stats) == len(expected)
+    for row in stats.itertuples(index=False):
+        reference = expected[(row.source, row.target)]
+        for name, value in reference.items():
+            assert getattr(row, name) == pytest.approx(value, nan_ok=True), (row.source, row.target, name)
@@ -0,0 +1,16 @@
+import os
+import pytest
+from conftest import ROOT
+from object_registry import read_event_log_csv
+from ocel_export import export_log
+
+
+@pytest.fixture(scope="module")
+def event_log():
+    return read_event_log_csv(os.path.join(ROOT, "post_ocel_inventory_management.csv"))
+
+
+def test_empty_log_exports_in_every_format(event_log, tmp_path):
+    df, registry = event_log
+    paths = export_log(df.iloc[:0], registry, str(tmp_path / "empty"), ["csv", "xml", "json", "sqlite"])
+    assert all(os.path.exists(path) for path in paths) and len(paths) == 4
@@ -0,0 +1,68 @@
+import asyncio
+import shutil
+import sqlite3
+import numpy as np
+import pytest
+import query_service
+from object_registry import event_log_csv_frame
+from query_service import QueryService, load_classified_log
+
+
+@pytest.fixture
+def db_copy(generated_db, tmp_path):
+    path = str(tmp_path / "inventory_management.db")
+    shutil.copy(generated_db, path)
+    return path
+
+
+def add_goods_issue(db_path, date, quantity):
+    conn = sqlite3.connect(db_path)
+    columns = [d[0] for d in conn.execute("SELECT * FROM GoodsReceiptsAndIssues LIMIT 1").description]
+    row = list(conn.execute("SELECT * FROM GoodsReceiptsAndIssues WHERE movement_type = 'Goods Issue'").fetchone())
+    row[columns.index("date_of_the_posting_in_the_document")] = date
+    row[columns.index("quantity")] = quantity
+    row[columns.index("document_number")] = -1 - int(quantity)
+    conn.execute("INSERT INTO GoodsReceiptsAndIssues VALUES (%s)" % ",".join("?" * len(row)), row)
+    conn.commit()
+    conn.close()
+
+
+def test_incremental_reload_matches_full_reload(db_copy):
+    log = load_classified_log(db_copy)
+    assert load_classified_log(db_copy, log) is log
+    for quantity in (3.0, 4.0):
+        add_goods_issue(db_copy, "2024-09-20", quantity)
+        log = load_classified_log(db_copy, log)
+        full = load_classified_log(db_copy)
+        assert event_log_csv_frame(log.df, log.registry).equals(event_log_csv_frame(full.df, full.registry))
+        for name in ("codes", "timestamps", "activities", "event_ids", "stock_before", "stock_after", "parameters"):
+            assert np.array_equal(getattr(log, name), getattr(full, name),
+                                  equal_nan=name not in ("activities", "event_ids"))
+
+
+def test_refresh_survives_a_failed_reload(db_copy, monkeypatch, caplog):
+    service = QueryService(db_copy, refresh_interval=0.01)
+    calls = []
+
+    def flaky_load(db_path, previous=None):
+        calls.append(db_path)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return load_classified_log(db_path, previous)
+
+    monkeypatch.setattr(query_service, "load_classified_log", flaky_load)
+    add_goods_issue(db_copy, "2024-09-20", 3.0)
+    monkeypatch.setattr(query_service, "database_version", lambda db_path: ("changed",))
+
+    async def run():
+        refresh = asyncio.create_task(service.refresh_loop())
+        while service.version != ("changed",) and not refresh.done():
+            await asyncio.sleep(0.01)
+        refresh.cancel()
+        await asyncio.gather(refresh, return_exceptions=True)
+
+    old_log = service.log
+    asyncio.run(asyncio.wait_for(run(), 60))
+    assert len(calls) == 2 and service.log is not old_log
+    assert "database is locked" in caplog.text
+    assert len(service.log.event_ids) == len(old_log.event_ids) + 1
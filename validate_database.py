@@ -0,0 +1,171 @@
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from db_access import ConnectionPool
+
+
+# (name, table, severity, query returning the keys of the offending rows)
+CHECKS = [
+    ("Sales order items without sales order document", "SalesOrderItems", "error", """
+        SELECT soi.sales_document_number, soi.item_number
+        FROM SalesOrderItems soi
+        WHERE NOT EXISTS (SELECT 1 FROM SalesOrderDocuments sod
+                          WHERE sod.sales_document_number = soi.sales_document_number)
+    """),
+    ("Sales order items with unknown material", "SalesOrderItems", "error", """
+        SELECT soi.sales_document_number, soi.item_number, soi.material_number
+        FROM SalesOrderItems soi
+        WHERE NOT EXISTS (SELECT 1 FROM Materials m WHERE m.material_number = soi.material_number)
+    """),
+    ("Purchase order items without purchase order document", "PurchaseOrderItems", "error", """
+        SELECT poi.purchase_order_number, poi.purchase_order_item_number
+        FROM PurchaseOrderItems poi
+        WHERE NOT EXISTS (SELECT 1 FROM PurchaseOrderDocuments pod
+                          WHERE pod.purchase_document_number = poi.purchase_order_number)
+    """),
+    ("Purchase order items with unknown material", "PurchaseOrderItems", "error", """
+        SELECT poi.purchase_order_number, poi.purchase_order_item_number, poi.material_number
+        FROM PurchaseOrderItems poi
+        WHERE NOT EXISTS (SELECT 1 FROM Materials m WHERE m.material_number = poi.material_number)
+    """),
+    ("Goods receipts for nonexistent purchase order lines", "GoodsReceiptsAndIssues", "error", """
+        SELECT gri.document_number, gri.purchase_document_number, gri.line_item_in_purchase_document
+        FROM GoodsReceiptsAndIssues gri
+        WHERE gri.movement_type = 'Goods Receipt'
+          AND NOT EXISTS (SELECT 1 FROM PurchaseOrderItems poi
+                          WHERE poi.purchase_order_number = gri.purchase_document_number
+                            AND poi.purchase_order_item_number = gri.line_item_in_purchase_document)
+    """),
+    ("Goods receipts for another material or plant than the purchase order line", "GoodsReceiptsAndIssues",
+     "warning", """
+        SELECT gri.document_number, gri.material_number, gri.plant, poi.material_number, poi.plant
+        FROM GoodsReceiptsAndIssues gri
+        JOIN PurchaseOrderItems poi ON poi.purchase_order_number = gri.purchase_document_number
+                                   AND poi.purchase_order_item_number = gri.line_item_in_purchase_document
+        WHERE gri.movement_type = 'Goods Receipt'
+          AND (poi.material_number <> gri.material_number OR poi.plant <> gri.plant)
+    """),
+    ("Goods receipts posted before the purchase order date", "GoodsReceiptsAndIssues", "warning", """
+        SELECT gri.document_number, gri.date_of_the_posting_in_the_document, pod.purchase_order_date
+        FROM GoodsReceiptsAndIssues gri
+        JOIN PurchaseOrderDocuments pod ON pod.purchase_document_number = gri.purchase_document_number
+        WHERE gri.movement_type = 'Goods Receipt'
+          AND gri.date_of_the_posting_in_the_document < pod.purchase_order_date
+    """),
+    ("Goods movements with unknown material", "GoodsReceiptsAndIssues", "error", """
+        SELECT gri.document_number, gri.material_number
+        FROM GoodsReceiptsAndIssues gri
+        WHERE NOT EXISTS (SELECT 1 FROM Materials m WHERE m.material_number = gri.material_number)
+    """),
+    ("Goods movements with unknown movement type or non-positive quantity", "GoodsReceiptsAndIssues", "warning", """
+        SELECT gri.document_number, gri.movement_type, gri.quantity
+        FROM GoodsReceiptsAndIssues gri
+        WHERE gri.movement_type NOT IN ('Goods Receipt', 'Goods Issue') OR NOT gri.quantity > 0
+    """),
+    ("Goods movements without posting date", "GoodsReceiptsAndIssues", "warning", """
+        SELECT gri.document_number, gri.material_number
+        FROM GoodsReceiptsAndIssues gri
+        WHERE gri.date_of_the_posting_in_the_document IS NULL
+    """),
+    ("Sales document flows to missing sales order items", "SalesDocumentFlows", "error", """
+        SELECT sdf.sales_document, sdf.sales_document_item
+        FROM SalesDocumentFlows sdf
+        WHERE NOT EXISTS (SELECT 1 FROM SalesOrderItems soi
+                          WHERE soi.sales_document_number = sdf.sales_document
+                            AND soi.item_number = sdf.sales_document_item)
+    """),
+    ("Material stocks with unknown material", "MaterialStocks", "error", """
+        SELECT ms.material_number, ms.plant, ms.storage_location
+        FROM MaterialStocks ms
+        WHERE NOT EXISTS (SELECT 1 FROM Materials m WHERE m.material_number = ms.material_number)
+    """),
+    ("Material stocks without goods movements", "MaterialStocks", "error", """
+        SELECT ms.material_number, ms.plant, ms.storage_location
+        FROM MaterialStocks ms
+        LEFT JOIN (SELECT DISTINCT material_number FROM GoodsReceiptsAndIssues) gri
+               ON gri.material_number = ms.material_number
+        WHERE gri.material_number IS NULL
+    """),
+    ("Order suggestions with unknown material", "OrderSuggestions", "error", """
+        SELECT os.order_number, os.order_position, os.article_number
+        FROM OrderSuggestions os
+        WHERE NOT EXISTS (SELECT 1 FROM Materials m WHERE m.material_number = os.article_number)
+    """),
+    ("Order suggestions delivered before they are ordered", "OrderSuggestions", "warning", """
+        SELECT os.order_number, os.order_position, os.order_date, os.delivery_date
+        FROM OrderSuggestions os
+        WHERE os.delivery_date < os.order_date
+    """),
+    ("Material documents with unknown material", "MaterialDocuments", "error", """
+        SELECT md.material_document_number, md.material_document_year, md.line_item
+        FROM MaterialDocuments md
+        WHERE NOT EXISTS (SELECT 1 FROM Materials m WHERE m.material_number = md.material_number)
+    """),
+    ("Purchase requisitions for nonexistent purchase order lines", "PurchaseRequisitions", "error", """
+        SELECT pr.purchase_requisition_number, pr.purchase_document_number, pr.item_number_of_purchasing_document
+        FROM PurchaseRequisitions pr
+        WHERE NOT EXISTS (SELECT 1 FROM PurchaseOrderItems poi
+                          WHERE poi.purchase_order_number = pr.purchase_document_number
+                            AND poi.purchase_order_item_number = pr.item_number_of_purchasing_document)
+    """),
+    ("Order quantities or prices that are not positive", "SalesOrderItems", "warning", """
+        SELECT soi.sales_document_number, soi.item_number, soi.order_quantity, soi.net_price
+        FROM SalesOrderItems soi
+        WHERE NOT soi.order_quantity > 0 OR NOT soi.net_price > 0
+    """),
+    ("Materials with net weight above gross weight", "Materials", "warning", """
+        SELECT m.material_number, m.net_weight, m.gross_weight
+        FROM Materials m
+        WHERE m.net_weight > m.gross_weight
+    """),
+]
+
+SAMPLE_SIZE = 5
+
+
+def check_query(check_sql):
+    # A single pass per check: total count of the violations plus a few sample keys
+    return "SELECT *, COUNT(*) OVER () AS violations FROM (%s) LIMIT %d" % (check_sql, SAMPLE_SIZE)
+
+
+def run_check(pool, check):
+    name, table, severity, check_sql = check
+    start = time.time()
+    with pool.connection() as conn:
+        rows = conn.execute(check_query(check_sql)).fetchall()
+    return {
+        "check": name,
+        "table": table,
+        "severity": severity,
+        "violations": rows[0][-1] if rows else 0,
+        "samples": [row[:-1] for row in rows],
+        "seconds": time.time() - start,
+    }
+
+
+def validate_database(db_path, checks=CHECKS, workers=4):
+    # sqlite3 releases the GIL while a statement runs, so the checks scan their tables in parallel
+    pool = ConnectionPool(db_path, size=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run_check, repeat(pool), checks))
+    finally:
+        pool.close()
+
+
+def print_report(report):
+    for result in report:
+        status = "OK" if result["violations"] == 0 else result["severity"].upper()
+        print("%-7s %-24s %8d  %s (%.2fs)" % (status, result["table"], result["violations"], result["check"],
+                                               result["seconds"]))
+        for sample in result["samples"]:
+            print("%42s%s" % ("", sample))
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'inventory_management.db'
+    report = validate_database(db_path)
+    print_report(report)
+    if any(r["violations"] and r["severity"] == "error" for r in report):
+        sys.exit(1)